@@ -0,0 +1,225 @@
+"""
+Admission control and backpressure for the analysis endpoints
+=============================================================
+
+Every /analyze or /compare request runs a whole PDF pipeline and competes for
+the same Gemini quota and CPU. AdmissionController lets at most
+`max_concurrent` pipelines run per worker process, queues up to `max_queued`
+more for at most `queue_timeout` seconds, and rejects the rest immediately
+with a Retry-After estimate. A per-client quota (shared across workers via
+SQLite) stops a single client from filling the queue; requests rejected
+before doing any work are refunded so they do not use it up.
+
+The concurrency and queue limits apply per worker process; gunicorn.conf.py
+sizes each worker's thread pool to match so that excess requests reach
+admit() and are rejected instead of waiting in gunicorn's own queue. Each
+worker publishes its counters to the shared SQLite state, so all_metrics()
+reports every worker, whichever one answers.
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from shared_state import SharedQuota, SharedWorkerMetrics
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """Page count read from the PDF's page tree, without extracting any text"""
+    import fitz  # PyMuPDF
+
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; maps to HTTP 429"""
+
+    def __init__(self, reason: str, message: str, retry_after: float):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class AdmissionTicket:
+    """An admitted request; refund() returns its quota unit if it is rejected after all"""
+
+    def __init__(self, quota: SharedQuota, client_id: str):
+        self.quota = quota
+        self.client_id = client_id
+        self.refunded = False
+
+    def refund(self):
+        if self.quota and not self.refunded:
+            self.quota.refund(self.client_id)
+            self.refunded = True
+
+
+class AdmissionController:
+    """Bounded concurrency plus a bounded, time-limited wait queue"""
+
+    def __init__(self, max_concurrent: int = 4, max_queued: int = 8, queue_timeout: float = 30.0,
+                 quota: SharedQuota = None, shared_metrics: SharedWorkerMetrics = None):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.quota = quota
+        self.shared_metrics = shared_metrics
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        self._avg_service_time = 10.0  # seconds, refined as requests finish
+        self._stats = {
+            'admitted': 0,
+            'completed': 0,
+            'max_queue_depth': 0,
+            'rejected': {}
+        }
+
+    @classmethod
+    def from_env(cls) -> 'AdmissionController':
+        """Build a controller from MAX_CONCURRENT_ANALYSES, MAX_QUEUED_ANALYSES, QUEUE_TIMEOUT, CLIENT_QUOTA and CLIENT_QUOTA_WINDOW"""
+        quota = SharedQuota(
+            limit=int(os.getenv('CLIENT_QUOTA', 30)),
+            window=float(os.getenv('CLIENT_QUOTA_WINDOW', 600))
+        )
+        return cls(
+            max_concurrent=int(os.getenv('MAX_CONCURRENT_ANALYSES', 4)),
+            max_queued=int(os.getenv('MAX_QUEUED_ANALYSES', 8)),
+            queue_timeout=float(os.getenv('QUEUE_TIMEOUT', 30)),
+            quota=quota,
+            shared_metrics=SharedWorkerMetrics('admission')
+        )
+
+    def record_rejection(self, reason: str):
+        """Count a rejection that happened outside admit() (e.g. an oversized upload)"""
+        with self._cond:
+            self._stats['rejected'][reason] = self._stats['rejected'].get(reason, 0) + 1
+        self._publish()
+
+    def _publish(self):
+        """Share this worker's counters with the other workers"""
+        if self.shared_metrics:
+            self.shared_metrics.publish(self.metrics())
+
+    def _estimated_wait(self, position: int) -> float:
+        """Rough seconds until a request at this queue position would start"""
+        return self._avg_service_time * (position // max(self.max_concurrent, 1) + 1)
+
+    @contextmanager
+    def admit(self, client_id: str):
+        """
+        Hold a pipeline slot for the duration of the with-block
+
+        The request counts against the client's quota only if it is admitted;
+        call refund() on the yielded ticket if it is rejected later without
+        doing any work (e.g. an oversized upload).
+
+        Raises:
+            AdmissionRejected: client over quota, queue full, or queue wait timed out
+        """
+        if self.quota:
+            retry_after = self.quota.hit(client_id)
+            if retry_after > 0:
+                self.record_rejection('client_quota')
+                raise AdmissionRejected('client_quota', "Request quota exceeded for this client. Try again later.", retry_after)
+        ticket = AdmissionTicket(self.quota, client_id)
+
+        try:
+            self._acquire_slot()
+        except AdmissionRejected as e:
+            ticket.refund()
+            self.record_rejection(e.reason)
+            raise
+        self._publish()
+
+        started = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._active -= 1
+                self._stats['completed'] += 1
+                self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+                self._cond.notify()
+            self._publish()
+
+    def _acquire_slot(self):
+        """Wait for a free pipeline slot, or raise AdmissionRejected"""
+        with self._cond:
+            if self._active >= self.max_concurrent:
+                if self._queued >= self.max_queued:
+                    raise AdmissionRejected('queue_full', "Server is busy. Try again later.",
+                                            self._estimated_wait(self._queued))
+
+                self._queued += 1
+                self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queued)
+                # Only reached when the worker is saturated, so the SQLite write under the lock is acceptable
+                self._publish()
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self._active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise AdmissionRejected('queue_timeout', "Server is busy. Try again later.",
+                                                    self._estimated_wait(self._queued))
+                        self._cond.wait(remaining)
+                finally:
+                    self._queued -= 1
+
+            self._active += 1
+            self._stats['admitted'] += 1
+
+    def metrics(self) -> Dict[str, any]:
+        """Snapshot of queue depth, limits and rejection counts for this worker"""
+        with self._cond:
+            return {
+                'pid': os.getpid(),
+                'active': self._active,
+                'queued': self._queued,
+                'max_concurrent': self.max_concurrent,
+                'max_queued': self.max_queued,
+                'avg_service_seconds': round(self._avg_service_time, 2),
+                'admitted': self._stats['admitted'],
+                'completed': self._stats['completed'],
+                'max_queue_depth': self._stats['max_queue_depth'],
+                'rejected': dict(self._stats['rejected'])
+            }
+
+    def all_metrics(self) -> Dict[str, any]:
+        """
+        Metrics of every worker (from the shared state) plus totals
+
+        Active and queued totals only count workers that are still running;
+        counters include workers that have since been recycled.
+        """
+        if not self.shared_metrics:
+            workers = [dict(self.metrics(), alive=True)]
+        else:
+            self._publish()
+            workers = self.shared_metrics.collect()
+
+        live = [worker for worker in workers if worker['alive']]
+        rejected = {}
+        for worker in workers:
+            for reason, count in worker['rejected'].items():
+                rejected[reason] = rejected.get(reason, 0) + count
+        return {
+            'reported_by': os.getpid(),
+            'total': {
+                'workers': len(live),
+                'active': sum(worker['active'] for worker in live),
+                'queued': sum(worker['queued'] for worker in live),
+                'admitted': sum(worker['admitted'] for worker in workers),
+                'completed': sum(worker['completed'] for worker in workers),
+                'max_queue_depth': max((worker['max_queue_depth'] for worker in workers), default=0),
+                'rejected': rejected
+            },
+            'workers': workers
+        }
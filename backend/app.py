@@ -1,9 +1,17 @@
 import os
 import time
 import uuid  # ### NEW CODE START ### - Added for unique temporary filenames
-from flask import Flask, request, jsonify, send_from_directory, url_for
+import functools
+import json
+import queue
+import threading
+import contextvars
+from contextlib import ExitStack
+from flask import (Flask, Response, request, jsonify, send_from_directory, send_file, url_for, make_response, g,
+                   stream_with_context)
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Make sure legal_pdf_analyzer.py is in the same directory or accessible
 from legal_pdf_analyzer import LegalPDFAnalyzer
@@ -11,19 +19,27 @@ from legal_pdf_analyzer import LegalPDFAnalyzer
 # Import the new comparator class. Make sure legal_pdf_comparator.py is in the same folder.
 from legal_pdf_comparator import LegalPDFComparator
 # ### NEW CODE END ###
+from admission import AdmissionController, AdmissionRejected, count_pdf_pages
+from clause_index import ClauseIndex, file_sha256
+from tile_cache import PageTileService
+from resource_accounting import ExpensiveRequestLog, track, stage, set_count, set_label
 
 # ========================
 # App Configuration
 # ========================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 FRONTEND_FOLDER = os.path.join(BASE_DIR, "../Frontend")
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
+UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", os.path.join(BASE_DIR, "uploads"))
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 app = Flask(__name__, static_folder=FRONTEND_FOLDER)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
+# Upload limits, checked before any text extraction
+app.config["MAX_CONTENT_LENGTH"] = int(float(os.getenv("MAX_UPLOAD_MB", 25)) * 1024 * 1024)
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", 300))
+
 # Allow CORS
 CORS(app, resources={r"/*": {"origins": "*"}})
 
@@ -40,6 +56,101 @@ except ValueError as e:
     print("Please ensure your GEMINI_API_KEY is set in your .env file.")
     analyzer = None
 
+# Searchable store of every clause classified by /analyze
+clause_index = ClauseIndex()
+
+# Rendered page previews of the generated PDFs
+tile_service = PageTileService()
+
+# Admission control shared by /analyze and /compare (limits are per worker process,
+# the per-client quota is shared by all workers)
+admission = AdmissionController.from_env()
+
+def admission_controlled(view):
+    """Run the view only when a pipeline slot is free; otherwise answer 429 with Retry-After"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # Behind a reverse proxy, wrap the app in werkzeug's ProxyFix so remote_addr is the real client
+        client_id = request.remote_addr or "unknown"
+        try:
+            with ExitStack() as slot:
+                ticket = slot.enter_context(admission.admit(client_id))
+                try:
+                    response = make_response(view(*args, **kwargs))
+                except RequestEntityTooLarge:
+                    # Rejected before any work was done: does not count against the client's quota
+                    ticket.refund()
+                    raise
+                if g.get("rejected_before_work"):
+                    ticket.refund()
+                if response.is_streamed:
+                    # The pipeline runs while the body is sent; hold the slot until then
+                    response.call_on_close(slot.pop_all().close)
+                return response
+        except AdmissionRejected as e:
+            response = jsonify({"success": False, "error": e.message, "reason": e.reason})
+            response.status_code = 429
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response
+    return wrapper
+
+# Most expensive analyses/comparisons of the last EXPENSIVE_REQUEST_WINDOW_HOURS, across all workers
+expensive_requests = ExpensiveRequestLog(
+    int(os.getenv("EXPENSIVE_REQUEST_LOG_SIZE", 20)),
+    window=float(os.getenv("EXPENSIVE_REQUEST_WINDOW_HOURS", 24)) * 3600
+)
+
+def resource_tracked(kind):
+    """
+    Account wall/CPU time, memory and model tokens of the view; report them in X-Resource-Usage
+
+    Streamed responses are accounted when the body has been sent, so they
+    carry no X-Resource-Usage header (see /metrics/expensive).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with ExitStack() as tracking:
+                usage = tracking.enter_context(track(kind))
+                response = make_response(view(*args, **kwargs))
+                if response.is_streamed:
+                    def finish_streamed(close=tracking.pop_all().close):
+                        close()
+                        expensive_requests.add(dict(usage.finish(), status=response.status_code))
+                    response.call_on_close(finish_streamed)
+                    return response
+            record = usage.finish()
+            record["status"] = response.status_code
+            expensive_requests.add(record)
+            response.headers["X-Resource-Usage"] = json.dumps(usage.summary(), separators=(",", ":"))
+            return response
+        return wrapper
+    return decorator
+
+def check_page_limit(*pdf_paths):
+    """Return an error response if any PDF has more pages than MAX_PDF_PAGES, else None"""
+    total_pages = 0
+    for path in pdf_paths:
+        try:
+            page_count = count_pdf_pages(path)
+        except Exception:
+            admission.record_rejection("unreadable_pdf")
+            g.rejected_before_work = True
+            return jsonify({"success": False, "error": "The uploaded file is not a readable PDF"}), 400
+        if page_count > MAX_PDF_PAGES:
+            admission.record_rejection("too_many_pages")
+            g.rejected_before_work = True
+            return jsonify({"success": False, "error": f"PDF has {page_count} pages; the limit is {MAX_PDF_PAGES}"}), 413
+        total_pages += page_count
+    set_count("pages", total_pages)
+    return None
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    admission.record_rejection("upload_too_large")
+    limit_mb = app.config["MAX_CONTENT_LENGTH"] / (1024 * 1024)
+    return jsonify({"success": False, "error": f"Upload is too large; the limit is {limit_mb:g} MB"}), 413
+
 # ========================
 # Frontend Routes (Your existing code - UNCHANGED)
 # ========================
@@ -60,80 +171,200 @@ def serve_frontend(filename):
 # API Routes
 # ========================
 
-# --- Your existing /analyze route - UNCHANGED ---
-@app.route("/analyze", methods=["POST"])
-def analyze_pdf():
+def save_analysis_upload():
+    """
+    Validate and save the PDF uploaded as "file"
+
+    Returns:
+        Tuple: (input path, filename, None), or (None, None, error response)
+    """
     if not analyzer:
-        return jsonify({"success": False, "error": "Analyzer is not configured. Check server logs."}), 500
+        return None, None, (jsonify({"success": False, "error": "Analyzer is not configured. Check server logs."}), 500)
 
     if "file" not in request.files:
-        return jsonify({"success": False, "error": "No file provided"}), 400
+        return None, None, (jsonify({"success": False, "error": "No file provided"}), 400)
 
     file = request.files["file"]
 
     if not file or file.filename == "":
-        return jsonify({"success": False, "error": "No file selected"}), 400
+        return None, None, (jsonify({"success": False, "error": "No file selected"}), 400)
 
     if not allowed_file(file.filename):
-        return jsonify({"success": False, "error": "Invalid file type. Only PDFs allowed"}), 400
+        return None, None, (jsonify({"success": False, "error": "Invalid file type. Only PDFs allowed"}), 400)
 
-    try:
-        # Save uploaded PDF
-        filename = secure_filename(file.filename)
-        input_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    filename = secure_filename(file.filename)
+    input_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    set_label(filename)
+    with stage("save"):
         file.save(input_path)
 
-        # Generate unique output filenames with timestamp
-        timestamp = int(time.time())
-        base_name = os.path.splitext(filename)[0]
-        highlighted_name = f"{base_name}_{timestamp}_highlighted.pdf"
-        summary_name = f"{base_name}_{timestamp}_summary.pdf"
+    page_limit_error = check_page_limit(input_path)
+    if page_limit_error:
+        return None, None, page_limit_error
+    return input_path, filename, None
 
-        highlighted_path = os.path.join(app.config["UPLOAD_FOLDER"], highlighted_name)
-        summary_path = os.path.join(app.config["UPLOAD_FOLDER"], summary_name)
-        
-        # We will now call the analysis steps manually to have full control
+def run_analysis(input_path, filename, on_classification=None):
+    """
+    Extract, classify, highlight, summarize and index one saved PDF
+
+    Args:
+        input_path (str): The uploaded PDF
+        filename (str): Its sanitized name
+        on_classification (Callable): Optional hook called with each block once classified
+
+    Returns:
+        Dict: results with the generated file names, or None if no text could be extracted
+    """
+    # Generate unique output filenames with timestamp
+    timestamp = int(time.time())
+    base_name = os.path.splitext(filename)[0]
+    highlighted_name = f"{base_name}_{timestamp}_highlighted.pdf"
+    summary_name = f"{base_name}_{timestamp}_summary.pdf"
+
+    highlighted_path = os.path.join(app.config["UPLOAD_FOLDER"], highlighted_name)
+    summary_path = os.path.join(app.config["UPLOAD_FOLDER"], summary_name)
+    
+    # We will now call the analysis steps manually to have full control
+    with stage("extract"):
         text_blocks = analyzer.extract_text(pdf_path=input_path)
-        if not text_blocks:
-            return jsonify({"success": False, "error": "No text could be extracted from the PDF."}), 400
-        
-        classified_blocks = analyzer.classify_text(text_blocks=text_blocks)
-        
+    if not text_blocks:
+        return None
+    set_count("clauses", len(text_blocks))
+    
+    with stage("classify"):
+        classified_blocks = analyzer.classify_text(text_blocks=text_blocks, on_classification=on_classification)
+    
+    with stage("highlight"):
         analyzer.highlight_pdf(
             pdf_path=input_path, 
             text_blocks=classified_blocks, 
             output_path=highlighted_path
         )
 
+    with stage("summary"):
         analyzer.generate_summary_pdf(
             text_blocks=classified_blocks,
             pdf_path=input_path,
             summary_output_path=summary_path
         )
+    
+    risk_summary = {'red': 0, 'yellow': 0, 'green': 0}
+    for block in classified_blocks:
+        if block.get('classification'):
+            risk_level = block['classification']['risk_level']
+            risk_summary[risk_level] = risk_summary.get(risk_level, 0) + 1
+    
+    # Keep the per-clause results searchable after the response is sent
+    with stage("index"):
+        document_hash = file_sha256(input_path)
+        try:
+            clause_index.add_document(document_hash, filename, classified_blocks, highlighted_name, summary_name)
+        except Exception as e:
+            print(f"⚠️  Could not index clauses for {filename}: {e}")
+    
+    return {
+        'document_hash': document_hash,
+        'total_clauses': len(classified_blocks),
+        'risk_summary': risk_summary,
+        'reused_clauses': sum(1 for block in classified_blocks if (block.get('classification') or {}).get('reused')),
+        'highlighted_name': highlighted_name,
+        'summary_name': summary_name
+    }
+
+def analysis_results(analysis):
+    """The /analyze response body for the results of run_analysis()"""
+    return {
+        'success': True,
+        'document_hash': analysis['document_hash'],
+        'total_clauses': analysis['total_clauses'],
+        'risk_summary': analysis['risk_summary'],
+        'reused_clauses': analysis['reused_clauses'],
+        "highlighted_pdf": url_for("serve_file", filename=analysis['highlighted_name'], _external=True),
+        "summary_pdf": url_for("serve_file", filename=analysis['summary_name'], _external=True),
+        "clauses_url": url_for("document_clauses", document_hash=analysis['document_hash'], _external=True)
+    }
+
+# --- Your existing /analyze route ---
+@app.route("/analyze", methods=["POST"])
+@admission_controlled
+@resource_tracked("analyze")
+def analyze_pdf():
+    try:
+        # Save uploaded PDF
+        input_path, filename, error = save_analysis_upload()
+        if error:
+            return error
+
+        analysis = run_analysis(input_path, filename)
+        if analysis is None:
+            return jsonify({"success": False, "error": "No text could be extracted from the PDF."}), 400
         
-        risk_summary = {'red': 0, 'yellow': 0, 'green': 0}
-        for block in classified_blocks:
-            if block.get('classification'):
-                risk_level = block['classification']['risk_level']
-                risk_summary[risk_level] = risk_summary.get(risk_level, 0) + 1
-        
-        results = {
-            'success': True,
-            'total_clauses': len(classified_blocks),
-            'risk_summary': risk_summary,
-            "highlighted_pdf": url_for("serve_file", filename=highlighted_name, _external=True),
-            "summary_pdf": url_for("serve_file", filename=summary_name, _external=True)
-        }
-        
-        return jsonify(results)
+        return jsonify(analysis_results(analysis))
 
     except Exception as e:
         print(f"An error occurred during analysis: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+# --- Same analysis, streamed as NDJSON: one "clause" event per classified clause (likely-risky
+#     clauses first), then a final "done" event with the /analyze body, or an "error" event ---
+@app.route("/analyze/stream", methods=["POST"])
+@admission_controlled
+@resource_tracked("analyze")
+def analyze_pdf_stream():
+    input_path, filename, error = save_analysis_upload()
+    if error:
+        return error
+
+    events = queue.Queue()
+
+    def on_classification(block):
+        classification = block['classification']
+        events.put({
+            "event": "clause",
+            "page": block['page'],
+            "paragraph_id": block.get('paragraph_id'),
+            "bbox": block.get('bbox'),
+            "risk_level": classification['risk_level'],
+            "reasoning": classification['reasoning'],
+            "reused": bool(classification.get('reused'))
+        })
+
+    def work():
+        try:
+            events.put({"event": "done", "analysis": run_analysis(input_path, filename, on_classification)})
+        except Exception as e:
+            print(f"An error occurred during analysis: {e}")
+            events.put({"event": "error", "error": str(e)})
+
+    # The pipeline runs in its own thread so clauses can be sent while it works;
+    # the copied context carries this request's resource accounting
+    worker = threading.Thread(target=contextvars.copy_context().run, args=(work,), daemon=True)
+
+    def generate():
+        worker.start()
+        try:
+            while True:
+                event = events.get()
+                if event["event"] == "done":
+                    analysis = event.pop("analysis")
+                    if analysis is None:
+                        event = {"event": "error", "error": "No text could be extracted from the PDF."}
+                    else:
+                        event.update(analysis_results(analysis))
+                yield json.dumps(event) + "\n"
+                if event["event"] != "clause":
+                    break
+        finally:
+            # Keep the admission slot until the pipeline is done, even if the client went away
+            worker.join()
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 # ### NEW CODE START ###
 # --- This is the new, completely separate route for the document comparison ---
 @app.route("/compare", methods=["POST"])
+@admission_controlled
+@resource_tracked("compare")
 def compare_pdfs():
     if 'file1' not in request.files or 'file2' not in request.files:
         return jsonify({"error": "Two files are required for comparison"}), 400
@@ -159,9 +390,15 @@ def compare_pdfs():
     file2.save(path2)
 
     try:
+        page_limit_error = check_page_limit(path1, path2)
+        if page_limit_error:
+            return page_limit_error
+
         # We create the comparator instance here, only when needed
+        set_label(f"{file1.filename} vs {file2.filename}")
         comparator = LegalPDFComparator()
-        comparison_result = comparator.compare_documents(path1, path2)
+        with stage("compare"):
+            comparison_result = comparator.compare_documents(path1, path2)
         return jsonify(comparison_result)
     except Exception as e:
         print(f"An error occurred during comparison: {e}")
@@ -175,13 +412,153 @@ def compare_pdfs():
 # ### NEW CODE END ###
 
 
+# --- N-way comparison: upload 2..MAX_COMPARE_DOCUMENTS PDFs under the "files" field ---
+MAX_COMPARE_DOCUMENTS = int(os.getenv("MAX_COMPARE_DOCUMENTS", 10))
+
+@app.route("/compare/multi", methods=["POST"])
+@admission_controlled
+@resource_tracked("compare_multi")
+def compare_many_pdfs():
+    files = request.files.getlist("files")
+    if len(files) < 2:
+        return jsonify({"error": "At least two files are required for comparison"}), 400
+    if len(files) > MAX_COMPARE_DOCUMENTS:
+        return jsonify({"error": f"At most {MAX_COMPARE_DOCUMENTS} files can be compared at once"}), 400
+    if not all(file and allowed_file(file.filename) for file in files):
+        return jsonify({"error": "All files must be valid PDFs"}), 400
+
+    temp_compare_dir = os.path.join(app.config["UPLOAD_FOLDER"], "temp_compare")
+    os.makedirs(temp_compare_dir, exist_ok=True)
+
+    paths = []
+    for file in files:
+        path = os.path.join(temp_compare_dir, str(uuid.uuid4()) + "_" + secure_filename(file.filename))
+        file.save(path)
+        paths.append(path)
+
+    try:
+        page_limit_error = check_page_limit(*paths)
+        if page_limit_error:
+            return page_limit_error
+
+        set_label(", ".join(file.filename for file in files))
+        comparator = LegalPDFComparator()
+        with stage("compare"):
+            comparison_result = comparator.compare_many(paths, filenames=[file.filename for file in files])
+        return jsonify(comparison_result)
+    except Exception as e:
+        print(f"An error occurred during comparison: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# --- Full-text search over clauses from past analyses ---
+@app.route("/clauses/search", methods=["GET"])
+def search_clauses():
+    risk = request.args.get("risk")
+    if risk and risk.lower() not in ("red", "yellow", "green"):
+        return jsonify({"success": False, "error": "risk must be red, yellow or green"}), 400
+
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        return jsonify({"success": False, "error": "offset and limit must be integers"}), 400
+
+    results = clause_index.search(
+        query=request.args.get("q"),
+        risk_level=risk,
+        doc_hash=request.args.get("document"),
+        offset=offset,
+        limit=limit
+    )
+    results["success"] = True
+    return jsonify(results)
+
+# --- Paginated clause-level results of one analysis, with bboxes for client-side overlays ---
+@app.route("/results/<document_hash>/clauses", methods=["GET"])
+def document_clauses(document_hash):
+    risk = request.args.get("risk")
+    if risk and risk.lower() not in ("red", "yellow", "green"):
+        return jsonify({"success": False, "error": "risk must be red, yellow or green"}), 400
+
+    try:
+        page = int(request.args["page"]) if request.args.get("page") not in (None, "") else None
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", 50))
+    except ValueError:
+        return jsonify({"success": False, "error": "page, offset and limit must be integers"}), 400
+
+    results = clause_index.document_clauses(
+        document_hash,
+        page=page,
+        risk_level=risk,
+        offset=offset,
+        limit=limit,
+        include_text=request.args.get("include_text") in ("1", "true")
+    )
+    if results is None:
+        return jsonify({"success": False, "error": "No analysis found for this document"}), 404
+
+    document = results["document"]
+    for key in ("highlighted_pdf", "summary_pdf"):
+        if document[key]:
+            document[key] = url_for("serve_file", filename=document[key], _external=True)
+    results["success"] = True
+    return jsonify(results)
+
+# --- One page of a generated PDF as a PNG tile: /tiles/<name>.pdf/<page>?zoom=1.5 (page is 0-based) ---
+@app.route("/tiles/<path:filename>/<int:page>", methods=["GET"])
+def page_tile(filename, page):
+    safe_name = secure_filename(filename)
+    pdf_path = os.path.join(app.config["UPLOAD_FOLDER"], safe_name)
+    if safe_name != filename or not allowed_file(safe_name) or not os.path.isfile(pdf_path):
+        return jsonify({"success": False, "error": "Document not found"}), 404
+
+    try:
+        zoom = float(request.args.get("zoom", 1.0))
+    except ValueError:
+        return jsonify({"success": False, "error": "zoom must be a number"}), 400
+
+    try:
+        tile_path, etag = tile_service.tile(pdf_path, page, zoom)
+    except IndexError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+
+    return send_file(tile_path, mimetype="image/png", etag=etag, conditional=True, max_age=86400)
+
+# --- Queue depth and rejection counters of all workers (shared state), with per-worker detail ---
+@app.route("/metrics")
+def metrics():
+    return jsonify({
+        "admission": admission.all_metrics(),
+        # Kept in each worker's memory, so this is the answering worker's index only
+        "similarity_index_pid": os.getpid(),
+        "similarity_index": analyzer.similarity_index.stats() if analyzer else None
+    })
+
+
+# --- Most expensive requests of all workers, with per-stage and per-call detail ---
+@app.route("/metrics/expensive")
+def expensive_requests_log():
+    return jsonify({
+        "reported_by": os.getpid(),
+        "window_hours": expensive_requests.window / 3600,
+        "requests": expensive_requests.top()
+    })
+
+
 # --- Your existing /uploads/<path:filename> route - UNCHANGED ---
 @app.route("/uploads/<path:filename>")
 def serve_file(filename):
     return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
 
 # ========================
-# Main (Your existing code - UNCHANGED)
+# Main (development server only)
+# For production use the pre-forked workers: gunicorn -c gunicorn.conf.py app:app
 # ========================
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark
+=====================
+
+Measures how long a cold `import app` (and the analyzer/comparator modules)
+takes in a fresh interpreter, and checks that the heavy PDF and Gemini
+libraries are not pulled in at import time. Prints a JSON report and exits
+non-zero when a budget is exceeded, so startup regressions can be caught
+in CI.
+
+Usage:
+    python bench_imports.py                  # report only
+    python bench_imports.py --max-ms 400     # fail if `import app` is slower
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODULES = ['app', 'legal_pdf_analyzer', 'legal_pdf_comparator']
+
+# Libraries that must only be imported on first use
+HEAVY_MODULES = ['pdfplumber', 'fitz', 'reportlab.platypus', 'google.generativeai']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{'ms': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, runs: int) -> dict:
+    """Import a module in `runs` fresh interpreters and summarize the timings"""
+    env = dict(os.environ)
+    env.setdefault('GEMINI_API_KEY', 'benchmark-placeholder')
+    timings = []
+    loaded = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        timings.append(sample['ms'])
+        loaded.update(sample['loaded'])
+    return {
+        'module': module,
+        'runs': runs,
+        'median_ms': round(statistics.median(timings), 1),
+        'min_ms': round(min(timings), 1),
+        'max_ms': round(max(timings), 1),
+        'heavy_modules_loaded': sorted(loaded)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the backend modules")
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument('--max-ms', type=float, default=None, help="budget for the median `import app` time")
+    args = parser.parse_args()
+
+    results = [measure(module, args.runs) for module in MODULES]
+    failures = []
+    for result in results:
+        if result['heavy_modules_loaded']:
+            failures.append(f"{result['module']} imports {', '.join(result['heavy_modules_loaded'])} at load time")
+        if args.max_ms is not None and result['module'] == 'app' and result['median_ms'] > args.max_ms:
+            failures.append(f"import app took {result['median_ms']} ms (budget {args.max_ms} ms)")
+
+    print(json.dumps({'results': results, 'failures': failures, 'passed': not failures}, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
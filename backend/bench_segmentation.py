@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Clause segmentation benchmark
+=============================
+
+Generates a corpus of contract-like PDFs whose clause boundaries are known
+(numbered sections and sub-clauses, lettered lists that belong to their
+lead-in sentence, plain paragraphs, a
+table of contents, running headers and page numbers, in several layouts)
+and runs extract_text() over it with the structure-aware segmentation and
+with the old vertical-gap grouping. For each it reports the blocks,
+characters and classification batches (model calls) that would be sent to
+the model, and how well the blocks line up with the real clauses: exact,
+merged with other clauses, split into fragments, or dropped.
+
+Usage:
+    python bench_segmentation.py                         # report only
+    python bench_segmentation.py --fail-on-regression    # fail if structure is not better
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+from typing import Dict, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SENTENCES = [
+    "The Supplier shall indemnify and hold harmless the Customer from any claims arising from the Services.",
+    "Either party may terminate this Agreement upon thirty days written notice to the other party.",
+    "The Customer shall pay all invoices within forty five days of receipt.",
+    "Late payments shall accrue interest at a rate of two percent per month.",
+    "In no event shall either party be liable for indirect or consequential damages.",
+    "The total liability of the Supplier shall not exceed the fees paid in the preceding twelve months.",
+    "Each party shall keep the Confidential Information of the other party strictly confidential.",
+    "The Supplier warrants that the Services will be performed in a professional manner.",
+    "This Agreement shall be governed by the laws of the State of New York.",
+    "Any dispute shall be finally resolved by binding arbitration.",
+    "The Customer waives any right to a jury trial in connection with this Agreement.",
+    "All intellectual property created under this Agreement shall vest in the Customer.",
+    "The Supplier may not assign this Agreement without the prior written consent of the Customer.",
+    "Neither party shall be responsible for delays caused by events beyond its reasonable control.",
+    "The Customer may audit the records of the Supplier once per calendar year.",
+    "Notices shall be delivered in writing to the addresses set out above.",
+]
+LIST_ITEMS = [
+    "any fees due under this Agreement;",
+    "the costs of collection;",
+    "reasonable attorney fees;",
+    "interest on overdue amounts;",
+    "taxes imposed on the Services;",
+    "travel expenses approved in writing;",
+]
+SECTIONS = ["Definitions", "Services", "Fees and Payment", "Term and Termination", "Confidentiality",
+            "Warranties", "Indemnification", "Limitation of Liability", "Intellectual Property",
+            "Governing Law", "Dispute Resolution", "General Provisions"]
+
+# Font size, leading, space after paragraphs and first-line indent of each layout
+LAYOUTS = [
+    {'name': 'compact', 'size': 10, 'leading': 12, 'space_after': 6, 'indent': 0},
+    {'name': 'indented', 'size': 11, 'leading': 14, 'space_after': 0, 'indent': 18},
+    {'name': 'double_spaced', 'size': 11, 'leading': 24, 'space_after': 6, 'indent': 0},
+]
+
+
+def generate_corpus(directory: str, count: int, seed: int) -> List[Dict]:
+    """Write `count` contracts and return their paths, layouts and true clauses"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.platypus import Paragraph, SimpleDocTemplate
+
+    rng = random.Random(seed)
+    documents = []
+    for n in range(count):
+        layout = LAYOUTS[n % len(LAYOUTS)]
+        body = ParagraphStyle('body', fontName='Helvetica', fontSize=layout['size'], leading=layout['leading'],
+                              spaceAfter=layout['space_after'], firstLineIndent=layout['indent'])
+        item = ParagraphStyle('item', parent=body, leftIndent=24, firstLineIndent=0)
+        heading = ParagraphStyle('heading', parent=body, fontName='Helvetica-Bold', fontSize=layout['size'] + 2,
+                                 leading=layout['size'] + 6, spaceBefore=8, spaceAfter=4, firstLineIndent=0)
+        toc = ParagraphStyle('toc', parent=body, firstLineIndent=0, spaceAfter=0)
+        title = f"Master Services Agreement {n}"
+
+        sections = rng.sample(SECTIONS, rng.randint(6, 10))
+        story = [Paragraph(title.upper(), heading)]
+        for number, name in enumerate(sections, 1):
+            story.append(Paragraph(f"{number}. {name} {'.' * 40} {number + 1}", toc))
+
+        clauses = []
+        for number, name in enumerate(sections, 1):
+            story.append(Paragraph(f"{number}. {name.upper()}", heading))
+            for sub in range(1, rng.randint(2, 5)):
+                text = f"{number}.{sub} " + ' '.join(rng.sample(SENTENCES, rng.randint(1, 3)))
+                if rng.random() < 0.3:
+                    # A list is one clause with its lead-in: the items mean nothing on their own
+                    text = text.rstrip('.') + ", including:"
+                    story.append(Paragraph(text, body))
+                    for letter_index, list_item in enumerate(rng.sample(LIST_ITEMS, rng.randint(2, 4))):
+                        item_text = f"({'abcd'[letter_index]}) {list_item}"
+                        story.append(Paragraph(item_text, item))
+                        text += ' ' + item_text
+                    clauses.append(text)
+                else:
+                    story.append(Paragraph(text, body))
+                    clauses.append(text)
+            if rng.random() < 0.5:
+                text = ' '.join(rng.sample(SENTENCES, rng.randint(3, 6)))
+                story.append(Paragraph(text, body))
+                clauses.append(text)
+
+        def decorate(canvas, doc):
+            canvas.setFont('Helvetica', 8)
+            canvas.drawString(72, letter[1] - 40, f"CONFIDENTIAL - {title}")
+            canvas.drawCentredString(letter[0] / 2, 30, f"Page {doc.page}")
+
+        path = os.path.join(directory, f"contract_{n:03d}_{layout['name']}.pdf")
+        SimpleDocTemplate(path, pagesize=letter).build(story, onFirstPage=decorate, onLaterPages=decorate)
+        documents.append({'path': path, 'layout': layout['name'], 'clauses': clauses,
+                          'headings': [f"{number}. {name.upper()}" for number, name in enumerate(sections, 1)]})
+    return documents
+
+
+def _squash(text: str) -> str:
+    return re.sub(r'\s+', '', text).lower()
+
+
+def score_blocks(blocks: List[Dict], clauses: List[str], headings: List[str]) -> Dict[str, int]:
+    """Classify every true clause as exact, merged, split or dropped in the produced blocks"""
+    texts = [_squash(block['text']) for block in blocks]
+    heading_prefixes = {_squash(h) for h in headings}
+    counts = {'exact': 0, 'merged': 0, 'split': 0, 'dropped': 0}
+    for clause in clauses:
+        target = _squash(clause)
+        if any(text == target or (text.endswith(target) and text[:-len(target)] in heading_prefixes) for text in texts):
+            counts['exact'] += 1
+        elif any(target in text for text in texts):
+            counts['merged'] += 1
+        elif any(text in target for text in texts):
+            counts['split'] += 1
+        else:
+            counts['dropped'] += 1
+    return counts
+
+
+def run(documents: List[Dict], segmentation: str) -> Dict:
+    """extract_text() every document with one segmentation mode and summarize"""
+    from legal_pdf_analyzer import LegalPDFAnalyzer
+
+    analyzer = LegalPDFAnalyzer(api_key='benchmark-placeholder', segmentation=segmentation)
+    totals = {'blocks': 0, 'chars_sent': 0, 'batches': 0, 'exact': 0, 'merged': 0, 'split': 0, 'dropped': 0}
+    by_layout = {}
+    clauses = 0
+    for document in documents:
+        with contextlib.redirect_stdout(io.StringIO()):
+            blocks = analyzer.extract_text(document['path'])
+        scores = score_blocks(blocks, document['clauses'], document['headings'])
+        scores.update({
+            'blocks': len(blocks),
+            'chars_sent': sum(len(block['text']) for block in blocks),
+            'batches': analyzer.count_batches(blocks)
+        })
+        for key, value in scores.items():
+            totals[key] += value
+            layout = by_layout.setdefault(document['layout'], dict.fromkeys(totals, 0))
+            layout[key] += value
+        clauses += len(document['clauses'])
+    totals['exact_rate'] = round(totals['exact'] / clauses, 3) if clauses else 0.0
+    totals['mean_block_chars'] = round(totals['chars_sent'] / totals['blocks'], 1) if totals['blocks'] else 0.0
+    return {'segmentation': segmentation, 'true_clauses': clauses, **totals, 'by_layout': by_layout}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare structure-aware segmentation with vertical-gap grouping")
+    parser.add_argument('--documents', type=int, default=12, help="PDFs in the generated corpus")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default=None, help="also write the JSON report to this file")
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help="fail unless structure segmentation sends fewer characters and bounds more clauses exactly")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='segbench-') as workdir:
+        # Keep the analyzer's shared cache out of the real state directory
+        os.environ['SHARED_STATE_DB'] = os.path.join(workdir, 'shared_state.sqlite3')
+        sys.path.insert(0, BASE_DIR)
+        documents = generate_corpus(workdir, args.documents, args.seed)
+        results = {mode: run(documents, mode) for mode in ('gap', 'structure')}
+
+    structure, gap = results['structure'], results['gap']
+    failures = []
+    if structure['chars_sent'] >= gap['chars_sent']:
+        failures.append(f"structure sends {structure['chars_sent']} chars, gap grouping {gap['chars_sent']}")
+    if structure['exact_rate'] <= gap['exact_rate']:
+        failures.append(f"structure bounds {structure['exact_rate']:.1%} of clauses exactly, gap grouping {gap['exact_rate']:.1%}")
+
+    report = {
+        'documents': args.documents,
+        'results': results,
+        'chars_saved': gap['chars_sent'] - structure['chars_sent'],
+        'failures': failures,
+        'passed': not failures
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if failures and args.fail_on_regression else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Cross-page repeated block detection
+===================================
+
+Running headers, footers and confidentiality legends are extracted again on
+every page. This module finds them before classification:
+
+- Boilerplate: the same text (page numbers and dates masked) at roughly the
+  same vertical position in the top or bottom margin of several pages.
+- Duplicates: blocks whose text is identical once case and whitespace are
+  normalized, wherever they appear.
+
+Duplicates are classified once and the result is fanned back out;
+boilerplate can additionally be dropped by policy.
+"""
+
+import re
+from typing import Dict, List, Tuple
+
+# Policies for repeated header/footer blocks
+POLICY_CLASSIFY_ONCE = 'classify_once'
+POLICY_DROP = 'drop'
+REPEATED_BLOCK_POLICIES = (POLICY_CLASSIFY_ONCE, POLICY_DROP)
+
+# Fraction of the page height at the top and bottom treated as header/footer area
+MARGIN_FRACTION = 0.12
+
+
+def normalize_block_text(text: str) -> str:
+    """Case and whitespace insensitive form used to spot duplicate blocks"""
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def _in_margin(block: Dict[str, any]) -> bool:
+    """True when the block sits in the header or footer area of its page"""
+    if not block.get('bbox') or not block.get('page_size'):
+        return False
+    height = block['page_size'][1]
+    return block['bbox'][3] <= height * MARGIN_FRACTION or block['bbox'][1] >= height * (1 - MARGIN_FRACTION)
+
+
+def _boilerplate_text(block: Dict[str, any]) -> str:
+    """Text with digits masked (page numbers, dates)"""
+    return re.sub(r'\d+', '#', normalize_block_text(block['text']))
+
+
+def _boilerplate_groups(text_blocks: List[Dict[str, any]], position_tolerance: float) -> Dict[int, Tuple[str, int]]:
+    """
+    Group margin blocks by masked text and vertical position
+
+    Blocks with the same masked text are sorted by their top edge and a new
+    group starts wherever the next block is more than position_tolerance
+    below the previous one, so a header drifting between 39.8 and 40.2
+    stays in one group instead of straddling a band boundary.
+
+    Returns:
+        Dict[int, Tuple[str, int]]: Group key of each margin block, by block index
+    """
+    by_text = {}
+    for idx, block in enumerate(text_blocks):
+        if _in_margin(block):
+            by_text.setdefault(_boilerplate_text(block), []).append(idx)
+
+    keys = {}
+    for text, indices in by_text.items():
+        indices.sort(key=lambda idx: text_blocks[idx]['bbox'][1])
+        cluster = 0
+        previous_top = None
+        for idx in indices:
+            top = text_blocks[idx]['bbox'][1]
+            if previous_top is not None and top - previous_top > position_tolerance:
+                cluster += 1
+            keys[idx] = (text, cluster)
+            previous_top = top
+    return keys
+
+
+def find_repeated_blocks(text_blocks: List[Dict[str, any]], min_pages: int = 3,
+                         position_tolerance: float = 20.0) -> List[int]:
+    """
+    Find header/footer style blocks repeated across pages
+
+    Args:
+        text_blocks (List[Dict]): Blocks as returned by extract_text()
+        min_pages (int): Number of distinct pages a block must appear on
+        position_tolerance (float): Largest vertical distance in points between neighbouring copies of a block
+
+    Returns:
+        List[int]: Indices of every block that belongs to a repeated group
+    """
+    groups = {}
+    for idx, key in _boilerplate_groups(text_blocks, position_tolerance).items():
+        groups.setdefault(key, []).append(idx)
+
+    repeated = []
+    for indices in groups.values():
+        if len({text_blocks[idx]['page'] for idx in indices}) >= min_pages:
+            repeated.extend(indices)
+    return sorted(repeated)
+
+
+def drop_repeated_blocks(text_blocks: List[Dict[str, any]], min_pages: int = 3,
+                         position_tolerance: float = 20.0) -> Tuple[List[Dict[str, any]], int]:
+    """
+    Remove repeated header/footer blocks from the list
+
+    Returns:
+        Tuple[List[Dict], int]: Remaining blocks and the number dropped
+    """
+    repeated = set(find_repeated_blocks(text_blocks, min_pages, position_tolerance))
+    kept = [block for idx, block in enumerate(text_blocks) if idx not in repeated]
+    return kept, len(repeated)
+
+
+def group_duplicate_blocks(text_blocks: List[Dict[str, any]], min_pages: int = 3,
+                           position_tolerance: float = 20.0) -> Tuple[List[Dict[str, any]], List[Tuple[Dict, Dict]]]:
+    """
+    Split blocks into the unique ones to classify and their duplicates
+
+    Repeated headers/footers are grouped even when their page numbers differ;
+    all other blocks are grouped only on identical normalized text.
+
+    Returns:
+        Tuple: (unique blocks in document order, [(duplicate block, canonical block), ...])
+    """
+    repeated = set(find_repeated_blocks(text_blocks, min_pages, position_tolerance))
+    boilerplate_keys = _boilerplate_groups(text_blocks, position_tolerance) if repeated else {}
+    canonical = {}
+    unique_blocks = []
+    duplicates = []
+    for idx, block in enumerate(text_blocks):
+        if idx in repeated:
+            key = ('repeated',) + boilerplate_keys[idx]
+        else:
+            key = ('text', normalize_block_text(block['text']))
+        if key in canonical:
+            duplicates.append((block, canonical[key]))
+        else:
+            canonical[key] = block
+            unique_blocks.append(block)
+    return unique_blocks, duplicates
@@ -0,0 +1,303 @@
+"""
+Searchable index of analyzed clauses
+====================================
+
+Every clause classified by /analyze is stored in SQLite together with its
+document hash, page, bounding box, risk level and reasoning. An FTS5 table
+over the clause text and reasoning answers queries such as "all red
+indemnity clauses" across past analyses without re-parsing any PDF, and the
+same rows back the paginated per-document results used for client-side
+overlays.
+"""
+
+import hashlib
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+from shared_state import BASE_DIR, connect
+
+DEFAULT_INDEX_PATH = os.path.join(BASE_DIR, "state", "clause_index.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_hash TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    total_clauses INTEGER NOT NULL,
+    highlighted_pdf TEXT,
+    summary_pdf TEXT,
+    analyzed_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS clauses (
+    id INTEGER PRIMARY KEY,
+    doc_hash TEXT NOT NULL REFERENCES documents(doc_hash),
+    page INTEGER NOT NULL,
+    paragraph_id INTEGER,
+    x0 REAL, y0 REAL, x1 REAL, y1 REAL,
+    risk_level TEXT,
+    reasoning TEXT,
+    text TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pages (
+    doc_hash TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    width REAL NOT NULL,
+    height REAL NOT NULL,
+    PRIMARY KEY (doc_hash, page)
+);
+
+CREATE INDEX IF NOT EXISTS idx_clauses_doc_page ON clauses(doc_hash, page);
+CREATE INDEX IF NOT EXISTS idx_clauses_risk ON clauses(risk_level);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS clauses_fts USING fts5(
+    text, reasoning, content='clauses', content_rowid='id', tokenize='porter unicode61'
+);
+
+-- Keep the full-text index in step with the clauses table
+CREATE TRIGGER IF NOT EXISTS clauses_ai AFTER INSERT ON clauses BEGIN
+    INSERT INTO clauses_fts(rowid, text, reasoning) VALUES (new.id, new.text, new.reasoning);
+END;
+CREATE TRIGGER IF NOT EXISTS clauses_ad AFTER DELETE ON clauses BEGIN
+    INSERT INTO clauses_fts(clauses_fts, rowid, text, reasoning) VALUES ('delete', old.id, old.text, old.reasoning);
+END;
+"""
+
+MAX_LIMIT = 200
+
+
+def file_sha256(path: str) -> str:
+    """Content hash identifying a document independently of its upload name"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fts_query(query: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 query: every word must match, as a prefix"""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class ClauseIndex:
+    """SQLite/FTS5 store of classified clauses from past analyses"""
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or os.getenv('CLAUSE_INDEX_DB', DEFAULT_INDEX_PATH)
+        conn = connect(self.db_path)
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def add_document(self, doc_hash: str, filename: str, text_blocks: List[Dict[str, any]],
+                     highlighted_pdf: str = None, summary_pdf: str = None):
+        """
+        Store (or replace) the classified clauses of one document
+
+        Args:
+            doc_hash (str): file_sha256() of the uploaded PDF
+            filename (str): Original upload name
+            text_blocks (List[Dict]): Blocks returned by classify_text()
+            highlighted_pdf (str): Name of the highlighted artifact in uploads/
+            summary_pdf (str): Name of the summary artifact in uploads/
+        """
+        rows = []
+        page_sizes = {}
+        for block in text_blocks:
+            if block.get('page_size'):
+                page_sizes[block['page']] = block['page_size']
+            bbox = block.get('bbox') or (None, None, None, None)
+            classification = block.get('classification') or {}
+            rows.append((
+                doc_hash, block['page'], block.get('paragraph_id'),
+                bbox[0], bbox[1], bbox[2], bbox[3],
+                classification.get('risk_level'), classification.get('reasoning'), block['text']
+            ))
+
+        conn = connect(self.db_path)
+        try:
+            # Take the write lock up front: a read transaction upgraded by the DELETE fails with
+            # "database is locked" straight away instead of waiting for the busy timeout
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM clauses WHERE doc_hash = ?", (doc_hash,))
+            conn.execute("DELETE FROM pages WHERE doc_hash = ?", (doc_hash,))
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_hash, filename, total_clauses, highlighted_pdf, summary_pdf, analyzed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_hash, filename, len(rows), highlighted_pdf, summary_pdf, time.time())
+            )
+            conn.executemany(
+                "INSERT INTO clauses (doc_hash, page, paragraph_id, x0, y0, x1, y1, risk_level, reasoning, text) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.executemany(
+                "INSERT INTO pages (doc_hash, page, width, height) VALUES (?, ?, ?, ?)",
+                [(doc_hash, page, size[0], size[1]) for page, size in page_sizes.items()]
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def search(self, query: str = None, risk_level: str = None, doc_hash: str = None,
+               offset: int = 0, limit: int = 20) -> Dict[str, any]:
+        """
+        Find clauses by full-text query and/or filters
+
+        Args:
+            query (str): Free text; every word must appear (prefix match, stemmed)
+            risk_level (str): 'red', 'yellow' or 'green'
+            doc_hash (str): Restrict to one document
+            offset (int): Number of results to skip
+            limit (int): Page size (capped at MAX_LIMIT)
+
+        Returns:
+            Dict: total match count plus one page of results, best matches first
+        """
+        limit = max(1, min(limit, MAX_LIMIT))
+        offset = max(0, offset)
+
+        joins = "FROM clauses c JOIN documents d ON d.doc_hash = c.doc_hash"
+        where = []
+        params = []
+        order = "d.analyzed_at DESC, c.doc_hash, c.page, c.id"
+
+        fts_query = _fts_query(query) if query else None
+        if fts_query:
+            joins += " JOIN clauses_fts ON clauses_fts.rowid = c.id"
+            where.append("clauses_fts MATCH ?")
+            params.append(fts_query)
+            order = "bm25(clauses_fts)"
+        if risk_level:
+            where.append("c.risk_level = ?")
+            params.append(risk_level.lower())
+        if doc_hash:
+            where.append("c.doc_hash = ?")
+            params.append(doc_hash)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        conn = connect(self.db_path)
+        try:
+            total = conn.execute(f"SELECT COUNT(*) {joins} {where_sql}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT c.doc_hash, d.filename, c.page, c.paragraph_id, c.x0, c.y0, c.x1, c.y1, "
+                f"c.risk_level, c.reasoning, c.text {joins} {where_sql} ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return {
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'results': [
+                {
+                    'document_hash': row[0],
+                    'filename': row[1],
+                    'page': row[2],
+                    'paragraph_id': row[3],
+                    'bbox': [row[4], row[5], row[6], row[7]] if row[4] is not None else None,
+                    'risk_level': row[8],
+                    'reasoning': row[9],
+                    'text': row[10]
+                }
+                for row in rows
+            ]
+        }
+
+    def document_clauses(self, doc_hash: str, page: int = None, risk_level: str = None,
+                         offset: int = 0, limit: int = 50, include_text: bool = False) -> Optional[Dict[str, any]]:
+        """
+        Clause-level results of one analysis, in document order
+
+        Bounding boxes are in PDF points with the origin at the top-left of
+        the page (pdfplumber coordinates); page sizes are returned alongside
+        so clients can scale overlays.
+
+        Args:
+            doc_hash (str): Document hash returned by /analyze
+            page (int): Only clauses on this 0-based page
+            risk_level (str): Only clauses with this risk level
+            offset (int): Number of clauses to skip
+            limit (int): Page size (capped at MAX_LIMIT)
+            include_text (bool): Include the clause text in each result
+
+        Returns:
+            Dict: document metadata, page sizes and one page of clauses, or None if unknown
+        """
+        limit = max(1, min(limit, MAX_LIMIT))
+        offset = max(0, offset)
+
+        where = ["doc_hash = ?"]
+        params = [doc_hash]
+        if page is not None:
+            where.append("page = ?")
+            params.append(page)
+        if risk_level:
+            where.append("risk_level = ?")
+            params.append(risk_level.lower())
+        where_sql = " AND ".join(where)
+
+        conn = connect(self.db_path)
+        try:
+            document = conn.execute(
+                "SELECT filename, total_clauses, highlighted_pdf, summary_pdf, analyzed_at FROM documents WHERE doc_hash = ?",
+                (doc_hash,)
+            ).fetchone()
+            if not document:
+                return None
+            risk_counts = dict(conn.execute(
+                "SELECT risk_level, COUNT(*) FROM clauses WHERE doc_hash = ? GROUP BY risk_level", (doc_hash,)
+            ).fetchall())
+            total = conn.execute(f"SELECT COUNT(*) FROM clauses WHERE {where_sql}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT id, page, paragraph_id, x0, y0, x1, y1, risk_level, reasoning, text FROM clauses "
+                f"WHERE {where_sql} ORDER BY page, id LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+            page_sizes = {
+                row[0]: [row[1], row[2]]
+                for row in conn.execute("SELECT page, width, height FROM pages WHERE doc_hash = ?", (doc_hash,))
+            }
+        finally:
+            conn.close()
+
+        clauses = []
+        for row in rows:
+            clause = {
+                'id': row[0],
+                'page': row[1],
+                'paragraph_id': row[2],
+                'bbox': [row[3], row[4], row[5], row[6]] if row[3] is not None else None,
+                'risk_level': row[7],
+                'reasoning': row[8]
+            }
+            if include_text:
+                clause['text'] = row[9]
+            clauses.append(clause)
+
+        return {
+            'document': {
+                'document_hash': doc_hash,
+                'filename': document[0],
+                'total_clauses': document[1],
+                'highlighted_pdf': document[2],
+                'summary_pdf': document[3],
+                'analyzed_at': document[4],
+                'risk_summary': {level: risk_counts.get(level, 0) for level in ('red', 'yellow', 'green')}
+            },
+            'coordinates': {'units': 'pt', 'origin': 'top-left'},
+            'page_sizes': {str(page_num): page_sizes[page_num] for page_num in sorted({c['page'] for c in clauses}) if page_num in page_sizes},
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'clauses': clauses
+        }
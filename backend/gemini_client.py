@@ -0,0 +1,79 @@
+"""
+Gemini model clients
+====================
+
+One place that configures the Gemini SDK for the analyzer and the
+comparator: transport, API endpoint, system instructions and the rate
+limit shared by every worker process. The SDK is imported and configured
+the first time a model is needed, so importing this module stays cheap.
+"""
+
+import os
+import threading
+
+from prompts import USE_SYSTEM_INSTRUCTION, prompt_contents
+from shared_state import SharedRateLimiter
+
+DEFAULT_MODEL_NAME = 'gemini-1.5-flash'
+
+
+class GeminiClient:
+    """Lazily configured Gemini models, one per system instruction"""
+
+    def __init__(self, api_key: str, model_name: str = DEFAULT_MODEL_NAME):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._instructed_models = {}
+        self._lock = threading.Lock()
+        # Minimum spacing between calls, shared by every worker process
+        self.rate_limiter = SharedRateLimiter('gemini', float(os.getenv('GEMINI_MIN_INTERVAL', 1.0)))
+
+    @property
+    def model(self):
+        """Model without a system instruction, created the first time it is needed"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+
+                    # GEMINI_TRANSPORT=rest keeps the client safe to share across forked workers
+                    genai.configure(
+                        api_key=self.api_key,
+                        transport=os.getenv('GEMINI_TRANSPORT') or None,
+                        # GEMINI_API_ENDPOINT points the client at another server, e.g. the load-test stand-in
+                        client_options={'api_endpoint': os.getenv('GEMINI_API_ENDPOINT')} if os.getenv('GEMINI_API_ENDPOINT') else None
+                    )
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def model_for(self, instruction: str):
+        """Model carrying instruction as its system instruction (the plain model when disabled)"""
+        if not USE_SYSTEM_INSTRUCTION:
+            return self.model
+        model = self._instructed_models.get(instruction)
+        if model is None:
+            self.model  # configures the SDK
+            import google.generativeai as genai
+            with self._lock:
+                model = self._instructed_models.setdefault(
+                    instruction, genai.GenerativeModel(self.model_name, system_instruction=instruction)
+                )
+        return model
+
+    def generate(self, instruction: str, content: str, stream: bool = True):
+        """
+        Send content under instruction
+
+        Call rate_limiter.wait() first; the wait is left to the caller so it is
+        not counted in the call's duration.
+
+        Args:
+            instruction (str): Minified instruction from prompts.py
+            content (str): Request body (clauses or documents)
+            stream (bool): Stream the response
+
+        Returns:
+            The SDK's GenerateContentResponse
+        """
+        return self.model_for(instruction).generate_content(prompt_contents(instruction, content), stream=stream)
@@ -0,0 +1,88 @@
+"""
+Production serving configuration
+================================
+
+Run from the backend folder:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The master process imports app.py once (preload_app), builds the
+LegalPDFAnalyzer, warms up its lazily imported PDF libraries and Gemini
+client, and then forks the workers, so every worker starts warm instead of
+repeating that setup. The classification cache
+and the Gemini rate limit live in the SQLite file from shared_state.py and
+are shared by all workers.
+
+Workers are recycled gracefully after a bounded number of requests so that
+memory held by large PDFs cannot grow without limit.
+
+Baseline (loadtest.py --requests 100 --concurrency 8, Gemini stand-in with
+0.5 s latency, 12 generated contracts of 1-8 pages, 20% /compare, single
+vCPU sandbox, October 2026):
+
+    server              req/s   uploads/min   p50 ms   p99 ms   peak RSS
+    dev server          3.01    180.7         2462     5433     214 MB
+    gunicorn 4 workers  3.63    217.8         1909     7298     762 MB
+
+Memory tracing is off by default: the dev server with RESOURCE_TRACE_MEMORY=1
+managed 0.59 req/s (p50 12562 ms, p99 28719 ms) in the same run.
+
+Re-run loadtest.py on the target hardware before sizing WEB_WORKERS.
+
+Settings can be overridden through environment variables:
+    WEB_BIND              address to listen on (default 0.0.0.0:5000)
+    WEB_WORKERS           number of worker processes (default 2 x CPUs + 1)
+    WEB_THREADS           threads per worker (default MAX_CONCURRENT_ANALYSES +
+                          MAX_QUEUED_ANALYSES + WEB_LIGHT_THREADS)
+    WEB_LIGHT_THREADS     threads kept for /metrics, /tiles and search on top of
+                          the analysis slots (default 4)
+
+The admission limits (MAX_CONCURRENT_ANALYSES, MAX_QUEUED_ANALYSES) apply per
+worker process, so the whole server runs up to WEB_WORKERS times as many
+analyses. Each worker needs a thread for every analysis it may run or queue,
+plus some for the cheap routes; with fewer threads the excess requests would
+wait unseen in gunicorn's own queue instead of being rejected with a 429.
+    WEB_TIMEOUT           seconds a request may run before its worker is replaced (default 300)
+    WEB_MAX_REQUESTS      requests served before a worker is recycled (default 200)
+"""
+
+import multiprocessing
+import os
+
+# The gRPC transport is not fork-safe; REST lets the pre-fork Gemini client be shared
+os.environ.setdefault("GEMINI_TRANSPORT", "rest")
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+# One thread per analysis slot and queue place, so admission control (not gunicorn) decides who waits
+threads = int(os.getenv("WEB_THREADS", int(os.getenv("MAX_CONCURRENT_ANALYSES", 4))
+                        + int(os.getenv("MAX_QUEUED_ANALYSES", 8))
+                        + int(os.getenv("WEB_LIGHT_THREADS", 4))))
+
+# Initialize the analyzer and model clients once, before forking
+preload_app = True
+
+# Analyses of long contracts call Gemini many times
+timeout = int(os.getenv("WEB_TIMEOUT", 300))
+graceful_timeout = 60
+keepalive = 5
+
+# Graceful worker recycling
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", 200))
+max_requests_jitter = max_requests // 4
+
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported and before any worker is forked
+    from app import analyzer
+    if analyzer:
+        analyzer.warm_up()
+    server.log.info("Analyzer loaded in master; forking %s workers x %s threads", server.cfg.workers, server.cfg.threads)
+
+
+def post_fork(server, worker):
+    server.log.info("Worker %s started (recycled after ~%s requests)", worker.pid, server.cfg.max_requests)
@@ -0,0 +1,131 @@
+"""
+Incremental JSON parsing for streamed Gemini responses
+======================================================
+
+Gemini streams its answer as arbitrary text chunks. IncrementalJSONParser
+scans those chunks as they arrive and hands back every JSON object that sits
+inside an array (e.g. each entry of "classifications") as soon as its closing
+brace has been received. Callers can act on results mid-response and keep
+whatever arrived before a truncated tail.
+"""
+
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class IncrementalJSONParser:
+    """Streaming scanner that emits completed array items of a JSON document"""
+
+    def __init__(self):
+        self.text = ''
+        self.items: List[Tuple[Optional[str], Dict[str, Any]]] = []
+        self._pos = 0
+        # One entry per open container: [bracket, start offset, key it lives under, current key]
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._root_span = None
+
+    @property
+    def complete(self) -> bool:
+        """True once the closing brace of the top-level object has been seen"""
+        return self._root_span is not None
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+        """
+        Consume the next chunk of model output
+
+        Args:
+            chunk (str): Raw text as streamed by the model
+
+        Returns:
+            List[Tuple]: (array key, object) pairs completed by this chunk
+        """
+        self.text += chunk
+        text = self.text
+        emitted = []
+
+        i = self._pos
+        while i < len(text) and self._root_span is None:
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._expect_key and self._stack[-1][0] == '{':
+                        try:
+                            self._stack[-1][3] = json.loads(text[self._string_start:i + 1])
+                        except ValueError:
+                            self._stack[-1][3] = None
+                        self._expect_key = False
+            elif not self._stack:
+                # Skip anything before the root object (```json fences, prose)
+                if ch == '{':
+                    self._stack.append(['{', i, None, None])
+                    self._expect_key = True
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in '{[':
+                parent = self._stack[-1]
+                key = parent[3] if parent[0] == '{' else parent[2]
+                self._stack.append([ch, i, key, None])
+                self._expect_key = ch == '{'
+            elif ch in '}]':
+                bracket, start, key, _ = self._stack.pop()
+                if not self._stack:
+                    self._root_span = (start, i + 1)
+                elif bracket == '{' and self._stack[-1][0] == '[':
+                    try:
+                        obj = json.loads(text[start:i + 1])
+                    except ValueError:
+                        obj = None
+                    if isinstance(obj, dict):
+                        emitted.append((key, obj))
+                self._expect_key = False
+            elif ch == ',':
+                self._expect_key = self._stack[-1][0] == '{'
+            elif ch == ':':
+                self._expect_key = False
+
+            i += 1
+
+        self._pos = i
+        self.items.extend(emitted)
+        return emitted
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Return the fully parsed top-level object, or None if it never completed"""
+        if self._root_span is None:
+            return None
+        start, end = self._root_span
+        try:
+            return json.loads(self.text[start:end])
+        except ValueError:
+            return None
+
+    def items_for(self, key: str) -> List[Dict[str, Any]]:
+        """All completed objects that were emitted from the array stored under key"""
+        return [obj for item_key, obj in self.items if item_key == key]
+
+
+def stream_text(response) -> Iterator[str]:
+    """
+    Yield the text of each chunk of a streamed generate_content response
+
+    Chunks without text parts (safety blocks, empty keep-alives) are skipped
+    instead of raising, so partial output is never lost.
+    """
+    for chunk in response:
+        try:
+            text = chunk.text
+        except (ValueError, IndexError):
+            continue
+        if text:
+            yield text
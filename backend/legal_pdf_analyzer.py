@@ -13,46 +13,79 @@ Date: September 2025
 """
 
 import os
-import json
 import re
 import time
-from typing import List, Dict, Tuple
+import hashlib
+from typing import List, Dict, Tuple, Callable, Optional, Set
 from dotenv import load_dotenv
 
-# PDF processing libraries
-import pdfplumber
-import fitz  # PyMuPDF
-
-# PDF generation for summary
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-
-# AI integration
-import google.generativeai as genai
+# PDF processing (pdfplumber, PyMuPDF), PDF generation (reportlab) and the
+# Gemini SDK are heavy to import, so each is imported on first use inside the
+# method that needs it. bench_imports.py guards this.
+from json_stream import IncrementalJSONParser, stream_text
+from block_dedup import (POLICY_DROP, REPEATED_BLOCK_POLICIES, drop_repeated_blocks,
+                         group_duplicate_blocks, normalize_block_text)
+from shared_state import SharedCache
+from gemini_client import GeminiClient
+from similarity_index import ClauseSimilarityIndex
+from resource_accounting import record_model_call, set_count
+from risk_priority import prioritize_blocks, risk_score
+from segmentation import segment_page
+from prompts import (CLASSIFY_INSTRUCTION, CLASSIFY_PROMPT_VERSION, CLASSIFY_TEMPLATE, SUMMARY_INSTRUCTION,
+                     SUMMARY_TEMPLATE, clause_batch_prompt, compact_text, legacy_clause_batch_chars,
+                     record_prompt_savings)
 
 # Load environment variables
 load_dotenv()
 
+# 'structure' splits on numbering, headings and sentences; 'gap' is the original vertical-gap grouping
+SEGMENTATION_MODES = ('structure', 'gap')
+
 class LegalPDFAnalyzer:
     """Main class for analyzing and highlighting legal PDF documents"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, repeated_block_policy: str = None, segmentation: str = None):
         """
         Initialize the analyzer with Gemini API credentials
         
         Args:
             api_key (str): Gemini API key (if None, loads from environment)
+            repeated_block_policy (str): 'classify_once' or 'drop' for headers/footers repeated
+                across pages (if None, loads REPEATED_BLOCK_POLICY from environment)
+            segmentation (str): 'structure' or 'gap' clause segmentation (if None, loads
+                CLAUSE_SEGMENTATION from environment)
         """
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         if not self.api_key:
             raise ValueError("Gemini API key is required. Set GEMINI_API_KEY environment variable or pass api_key parameter.")
         
-        # Configure Gemini AI
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.repeated_block_policy = repeated_block_policy or os.getenv('REPEATED_BLOCK_POLICY', 'classify_once')
+        if self.repeated_block_policy not in REPEATED_BLOCK_POLICIES:
+            raise ValueError(f"Unknown repeated block policy '{self.repeated_block_policy}'. Use one of: {', '.join(REPEATED_BLOCK_POLICIES)}")
+        
+        self.segmentation = segmentation or os.getenv('CLAUSE_SEGMENTATION', 'structure')
+        if self.segmentation not in SEGMENTATION_MODES:
+            raise ValueError(f"Unknown segmentation '{self.segmentation}'. Use one of: {', '.join(SEGMENTATION_MODES)}")
+        
+        # Gemini models and the rate limit shared by every worker process, configured on first use
+        self.gemini = GeminiClient(self.api_key)
+        
+        # Classification cache, shared by every worker process
+        self.cache = SharedCache()
+        self.cache_ttl = float(os.getenv('CLASSIFICATION_CACHE_TTL', 7 * 24 * 3600))
+        
+        # Near-duplicate clauses (different names, dates, amounts) reuse earlier classifications
+        self.similarity_index = ClauseSimilarityIndex(
+            threshold=float(os.getenv('SIMILARITY_THRESHOLD', 0.7)),
+            max_entries=int(os.getenv('SIMILARITY_INDEX_SIZE', 20000))
+        )
+        
+        # Clauses per model call: up to batch_size clauses, split earlier once batch_chars is reached
+        self.batch_size = int(os.getenv('CLASSIFY_BATCH_SIZE', 20))
+        self.batch_chars = int(os.getenv('CLASSIFY_BATCH_CHARS', 8000))
+        
+        # Send clauses that look risky (liability, indemnity, penalties, ...) to the model first
+        self.risk_first = os.getenv('RISK_FIRST_SCHEDULING', '1') != '0'
         
         # Color mapping for highlights
         self.color_map = {
@@ -61,6 +94,13 @@ class LegalPDFAnalyzer:
             'green': (0.0, 1.0, 0.0)     # RGB for green
         }
     
+    def warm_up(self):
+        """Import every heavy dependency and build the model client now (e.g. before forking workers)"""
+        import pdfplumber
+        import fitz
+        import reportlab.platypus
+        self.gemini.model_for(CLASSIFY_INSTRUCTION)
+    
     def extract_text(self, pdf_path: str) -> List[Dict[str, any]]:
         """
         Extract text from PDF document with position information
@@ -71,31 +111,48 @@ class LegalPDFAnalyzer:
         Returns:
             List[Dict]: List of text blocks with content and position info
         """
+        import pdfplumber
+        
         print("📄 Extracting text from PDF...")
         text_blocks = []
         
         try:
             with pdfplumber.open(pdf_path) as pdf:
                 for page_num, page in enumerate(pdf.pages):
-                    # Extract text with bounding boxes
-                    words = page.extract_words(keep_blank_chars=True)
+                    # Extract text with bounding boxes (and font cues for structure segmentation)
+                    if self.segmentation == 'structure':
+                        words = page.extract_words(keep_blank_chars=True, extra_attrs=['size', 'fontname'])
+                    else:
+                        words = page.extract_words(keep_blank_chars=True)
                     
                     if not words:
                         continue
                     
                     # Group words into paragraphs/clauses
-                    paragraphs = self._group_words_into_paragraphs(words)
+                    if self.segmentation == 'structure':
+                        # segment_page already drops fragments too short to matter
+                        paragraphs = segment_page(words)
+                        min_length = 0
+                    else:
+                        paragraphs = self._group_words_into_paragraphs(words)
+                        min_length = 50
                     
                     for para_idx, paragraph in enumerate(paragraphs):
-                        if len(paragraph['text'].strip()) > 50:  # Only analyze substantial text
+                        if len(paragraph['text'].strip()) > min_length:  # Only analyze substantial text
                             text_blocks.append({
                                 'page': page_num,
                                 'paragraph_id': para_idx,
                                 'text': paragraph['text'],
                                 'bbox': paragraph['bbox'],  # (x0, y0, x1, y1)
+                                'page_size': (page.width, page.height),
                                 'classification': None  # Will be filled by classify_text()
                             })
             
+            if self.repeated_block_policy == POLICY_DROP:
+                text_blocks, dropped = drop_repeated_blocks(text_blocks)
+                if dropped:
+                    print(f"🧹 Dropped {dropped} repeated header/footer blocks")
+            
             print(f"✅ Extracted {len(text_blocks)} text blocks from {len(pdf.pages)} pages")
             return text_blocks
             
@@ -153,93 +210,139 @@ class LegalPDFAnalyzer:
         
         return paragraphs
     
-    def classify_text(self, text_blocks: List[Dict[str, any]]) -> List[Dict[str, any]]:
+    def classify_text(self, text_blocks: List[Dict[str, any]],
+                      on_classification: Optional[Callable[[Dict[str, any]], None]] = None) -> List[Dict[str, any]]:
         """
         Send text blocks to Gemini API for risk classification
         
+        Responses are streamed, so each block is classified (and on_classification
+        called) as soon as its JSON object arrives rather than when the batch ends.
+        Blocks repeated across the document are sent once and the result is
+        copied to every duplicate. Clauses classified before (by any worker)
+        are answered from the shared cache, and near-duplicates of earlier
+        clauses reuse their classification (flagged with 'reused'); the
+        similarity lookup happens as each batch is formed, so it also finds
+        clauses classified by earlier batches of the same document. The rest
+        are sent likely-risky first (see risk_priority.py), so red clauses
+        reach on_classification early; the returned list keeps document order.
+        
         Args:
             text_blocks (List[Dict]): List of text blocks to classify
+            on_classification (Callable): Optional progress hook called with each block once classified
             
         Returns:
             List[Dict]: Text blocks with classification results
         """
         print("🤖 Classifying text with Gemini AI...")
         
-        # Prepare the prompt for Gemini
-        system_prompt = """
-        You are a legal risk assessment AI. Analyze the following legal text clauses and classify each one as:
-        - RED: Highly dangerous/risky clauses (severe penalties, unfair terms, major liabilities)
-        - YELLOW: Moderate risk clauses (standard terms with some concerns)
-        - GREEN: Safe clauses (standard, favorable, or neutral terms)
-        
-        Return your analysis as JSON in this exact format:
-        {
-            "classifications": [
-                {
-                    "clause_id": 0,
-                    "risk_level": "RED|YELLOW|GREEN",
-                    "reasoning": "Brief explanation of the classification"
-                }
-            ]
-        }
-        """
+        # Note how long the first red clause took to surface
+        started = time.perf_counter()
+        first_red_seen = False
+        
+        def _report(block):
+            nonlocal first_red_seen
+            if not first_red_seen and block['classification']['risk_level'] == 'red':
+                first_red_seen = True
+                elapsed_ms = int((time.perf_counter() - started) * 1000)
+                set_count('first_red_ms', elapsed_ms)
+                print(f"🔴 First red clause found after {elapsed_ms / 1000:.1f}s (page {block['page'] + 1})")
+            if on_classification:
+                on_classification(block)
+        
+        tokens_saved = 0
+        
+        # Classify each distinct block once
+        unique_blocks, duplicates = group_duplicate_blocks(text_blocks)
+        if duplicates:
+            print(f"🧹 Skipping {len(duplicates)} repeated blocks ({len(unique_blocks)} unique)")
+        
+        # Answer previously seen clauses from the cache
+        pending_blocks = []
+        cache_hits = 0
+        for block in unique_blocks:
+            cached = self.cache.get('classification', self._cache_key(block['text']))
+            if not cached:
+                pending_blocks.append(block)
+                continue
+            block['classification'] = cached
+            cache_hits += 1
+            _report(block)
+        if cache_hits:
+            print(f"💾 Reused {cache_hits} cached classifications")
+        unique_blocks = pending_blocks
+        if self.risk_first and unique_blocks:
+            unique_blocks = prioritize_blocks(unique_blocks)
+            flagged = sum(1 for block in unique_blocks if risk_score(block['text']) > 0)
+            print(f"🎯 Sending {flagged} likely-risky clauses first")
+        
+        # Near-duplicates of clauses classified before (including earlier batches) are not sent
+        similar_hits = 0
         
-        for i in range(0, len(text_blocks), 5):  # Process in batches of 5
-            batch = text_blocks[i:i+5]
+        def reuse_similar(block):
+            nonlocal similar_hits
+            match = self.similarity_index.lookup(block['text'])
+            if not match:
+                return False
+            classification, similarity = match
+            classification['reused'] = True
+            classification['similarity'] = round(similarity, 3)
+            block['classification'] = classification
+            similar_hits += 1
+            _report(block)
+            return True
+        
+        for batch_num, batch in enumerate(self._iter_batches(unique_blocks, skip=reuse_similar), 1):
+            
+            # Prepare batch prompt: one "[id] text" line per clause
+            texts = [block['text'] for block in batch]
+            batch_prompt = clause_batch_prompt(texts)
+            tokens_saved += record_prompt_savings(
+                CLASSIFY_TEMPLATE, legacy_clause_batch_chars(texts), CLASSIFY_INSTRUCTION + batch_prompt
+            )
             
-            # Prepare batch prompt
-            batch_prompt = system_prompt + "\n\nAnalyze these clauses:\n\n"
-            for idx, block in enumerate(batch):
-                batch_prompt += f"Clause {idx}: {block['text']}\n\n"
+            # Batch offsets that already received a classification from the stream
+            classified = set()
             
             try:
-                print(f"📡 Processing batch {i//5 + 1}/{(len(text_blocks) + 4)//5}...")
+                print(f"📡 Processing batch {batch_num} ({len(batch)} clauses)...")
                 
-                # Send to Gemini
-                response = self.model.generate_content(batch_prompt)
+                # Rate limiting (shared across workers)
+                self.gemini.rate_limiter.wait()
                 
-                # Parse JSON response
-                try:
-                    # Extract JSON from response
-                    response_text = response.text
-                    json_start = response_text.find('{')
-                    json_end = response_text.rfind('}') + 1
-                    json_str = response_text[json_start:json_end]
-                    
-                    result = json.loads(json_str)
-                    classifications = result.get('classifications', [])
-                    
-                    # Apply classifications to text blocks
-                    for j, classification in enumerate(classifications):
-                        if i + j < len(text_blocks):
-                            risk_level = classification.get('risk_level', 'YELLOW').lower()
-                            text_blocks[i + j]['classification'] = {
-                                'risk_level': risk_level,
-                                'reasoning': classification.get('reasoning', 'No reasoning provided')
-                            }
-                            
-                except json.JSONDecodeError as e:
-                    print(f"⚠️  JSON parse error for batch {i//5 + 1}: {str(e)}")
-                    # Fallback: classify as yellow (moderate risk)
-                    for j in range(len(batch)):
-                        if i + j < len(text_blocks):
-                            text_blocks[i + j]['classification'] = {
-                                'risk_level': 'yellow',
-                                'reasoning': 'Classification failed - defaulted to moderate risk'
-                            }
+                # Stream from Gemini and apply each classification as soon as it is complete
+                # (the instruction is sent once per model as its system instruction, see prompts.py)
+                call_started = time.perf_counter()
+                response = self.gemini.generate(CLASSIFY_INSTRUCTION, batch_prompt)
+                parser = IncrementalJSONParser()
+                for chunk_text in stream_text(response):
+                    for key, classification in parser.feed(chunk_text):
+                        if key == 'classifications':
+                            self._apply_classification(batch, classification, classified, _report)
+                record_model_call(response, time.perf_counter() - call_started)
                 
-                # Rate limiting
-                time.sleep(1)
+                if len(classified) < len(batch):
+                    if not classified:
+                        print(f"⚠️  JSON parse error for batch {batch_num}: no complete classification in response")
+                        reasoning = 'Classification failed - defaulted to moderate risk'
+                    else:
+                        print(f"⚠️  Batch {batch_num} response was incomplete: kept {len(classified)}/{len(batch)} classifications")
+                        reasoning = 'Classification missing from truncated response - defaulted to moderate risk'
+                    self._apply_fallback(batch, classified, reasoning, _report)
                 
             except Exception as e:
-                print(f"❌ Error classifying batch {i//5 + 1}: {str(e)}")
-                # Fallback classification
-                for j in range(len(batch)):
-                    if i + j < len(text_blocks):
-                        text_blocks[i + j]['classification'] = {
-                            'risk_level': 'yellow',
-                            'reasoning': f'API error - defaulted to moderate risk: {str(e)}'
-                        }
+                print(f"❌ Error classifying batch {batch_num}: {str(e)}")
+                # Fallback classification for whatever the stream did not deliver
+                self._apply_fallback(batch, classified, f'API error - defaulted to moderate risk: {str(e)}', _report)
+        
+        if similar_hits:
+            print(f"🔁 Reused {similar_hits} classifications from similar clauses")
+        if tokens_saved:
+            print(f"✂️  Compact prompts saved ~{tokens_saved} tokens on this document")
+        
+        # Fan results back out to the repeated blocks
+        for block, canonical_block in duplicates:
+            block['classification'] = dict(canonical_block['classification'])
+            _report(block)
         
         # Print classification summary
         risk_counts = {'red': 0, 'yellow': 0, 'green': 0}
@@ -255,6 +358,76 @@ class LegalPDFAnalyzer:
         
         return text_blocks
     
+    def _iter_batches(self, blocks: List[Dict[str, any]],
+                      skip: Optional[Callable[[Dict[str, any]], bool]] = None):
+        """
+        Yield blocks (in order) in batches bounded by clause count and total characters
+        
+        skip(block) is called only when the block is about to join a batch, i.e.
+        after every earlier batch has been processed; blocks it returns True for
+        are left out.
+        """
+        batch, batch_chars = [], 0
+        for block in blocks:
+            if batch and (len(batch) >= self.batch_size or batch_chars + len(block['text']) > self.batch_chars):
+                yield batch
+                batch, batch_chars = [], 0
+            if skip and skip(block):
+                continue
+            batch.append(block)
+            batch_chars += len(block['text'])
+        if batch:
+            yield batch
+    
+    def count_batches(self, blocks: List[Dict[str, any]]) -> int:
+        """Number of model calls classify_text() needs for these blocks when nothing is cached"""
+        return sum(1 for _ in self._iter_batches(blocks))
+    
+    def _apply_classification(self, batch: List[Dict[str, any]], classification: Dict[str, any],
+                              classified: Set[int], on_classification: Optional[Callable] = None):
+        """Attach one streamed classification object to its block in the batch"""
+        # Trust the model's clause_id when it is usable, otherwise take the next open slot
+        j = classification.get('clause_id')
+        if isinstance(j, str) and j.strip().isdigit():
+            j = int(j)
+        if not isinstance(j, int) or not 0 <= j < len(batch) or j in classified:
+            j = next((k for k in range(len(batch)) if k not in classified), None)
+            if j is None:
+                return
+        
+        risk_level = str(classification.get('risk_level', 'YELLOW')).lower()
+        if risk_level not in self.color_map:
+            risk_level = 'yellow'
+        batch[j]['classification'] = {
+            'risk_level': risk_level,
+            'reasoning': classification.get('reasoning', 'No reasoning provided')
+        }
+        classified.add(j)
+        self.cache.set('classification', self._cache_key(batch[j]['text']), batch[j]['classification'], ttl=self.cache_ttl)
+        self.similarity_index.add(batch[j]['text'], batch[j]['classification'])
+        if on_classification:
+            on_classification(batch[j])
+    
+    def _cache_key(self, text: str) -> str:
+        """Cache key for a clause: model name, prompt version and normalized clause text"""
+        return hashlib.sha256(
+            f"{self.gemini.model_name}:{CLASSIFY_PROMPT_VERSION}\n{normalize_block_text(text)}".encode('utf-8')
+        ).hexdigest()
+    
+    def _apply_fallback(self, batch: List[Dict[str, any]], classified: Set[int], reasoning: str,
+                        on_classification: Optional[Callable] = None):
+        """Default every block of the batch that has no classification yet to moderate risk"""
+        for j in range(len(batch)):
+            if j in classified:
+                continue
+            batch[j]['classification'] = {
+                'risk_level': 'yellow',
+                'reasoning': reasoning
+            }
+            classified.add(j)
+            if on_classification:
+                on_classification(batch[j])
+    
     def highlight_pdf(self, pdf_path: str, text_blocks: List[Dict[str, any]], output_path: str):
         """
         Create highlighted PDF based on risk classifications
@@ -264,6 +437,8 @@ class LegalPDFAnalyzer:
             text_blocks (List[Dict]): Classified text blocks
             output_path (str): Path for the highlighted output PDF
         """
+        import fitz  # PyMuPDF
+        
         print("🎨 Creating highlighted PDF...")
         
         try:
@@ -320,6 +495,12 @@ class LegalPDFAnalyzer:
             pdf_path (str): Original PDF file path
             summary_output_path (str): Path for the summary PDF
         """
+        from reportlab.lib.pagesizes import letter
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import inch
+        from reportlab.lib import colors
+        
         print("📋 Generating user-friendly summary PDF...")
         
         try:
@@ -428,19 +609,13 @@ class LegalPDFAnalyzer:
             # Combine all text for summary
             full_text = " ".join([block['text'][:200] for block in text_blocks[:10]])  # First 10 blocks, 200 chars each
             
-            summary_prompt = f"""
-            Please provide a clear, simple summary of this legal document in 2-3 paragraphs that a non-lawyer can understand.
-            Focus on:
-            1. What type of document this is
-            2. Main purpose and key terms
-            3. Important obligations or rights
-            
-            Document text: {full_text}
-            
-            Write in simple, plain English avoiding legal jargon.
-            """
+            summary_prompt = f"Document text: {compact_text(full_text)}"
+            record_prompt_savings(SUMMARY_TEMPLATE, len(full_text), SUMMARY_INSTRUCTION + summary_prompt)
             
-            response = self.model.generate_content(summary_prompt)
+            self.gemini.rate_limiter.wait()
+            call_started = time.perf_counter()
+            response = self.gemini.generate(SUMMARY_INSTRUCTION, summary_prompt, stream=False)
+            record_model_call(response, time.perf_counter() - call_started)
             return response.text
             
         except Exception as e:
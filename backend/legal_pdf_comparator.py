@@ -1,27 +1,51 @@
 # legal_pdf_comparator.py
 import os
-import json
-from typing import Dict
+import time
+from typing import Dict, List
 from dotenv import load_dotenv
 
-import pdfplumber
-import google.generativeai as genai
+# pdfplumber and the Gemini SDK are imported on first use to keep startup fast
+
+from json_stream import IncrementalJSONParser, stream_text
+from shared_state import SharedCache
+from gemini_client import GeminiClient
+from clause_index import file_sha256
+from resource_accounting import record_model_call
+from prompts import (COMPARE_INSTRUCTION, COMPARE_TEMPLATE, PROFILE_INSTRUCTION, PROFILE_TEMPLATE,
+                     compact_text, record_prompt_savings)
 
 # No need for reportlab here as we are sending JSON to the frontend
 # All reportlab imports have been removed.
 
 load_dotenv()
 
+# Aspects every document is profiled on, so N-way comparisons line up
+DEFAULT_ASPECTS = [
+    "Liability",
+    "Indemnification",
+    "Termination",
+    "Payment Terms",
+    "Confidentiality",
+    "Intellectual Property",
+    "Warranties",
+    "Governing Law & Disputes",
+]
+
 class LegalPDFComparator:
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("Gemini API key is required. Set GEMINI_API_KEY in .env or pass api_key.")
 
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel("gemini-1.5-flash") # Using pro for higher quality legal analysis
+        # Gemini models and the rate limit shared by every worker process, configured on first use
+        self.gemini = GeminiClient(self.api_key)
+        # Per-document profiles for N-way comparison, shared by all workers
+        self.cache = SharedCache()
+        self.profile_ttl = float(os.getenv("DOCUMENT_PROFILE_TTL", 30 * 24 * 3600))
 
     def extract_text(self, pdf_path: str, max_pages: int = 5) -> str:
+        import pdfplumber
+
         text_content = []
         with pdfplumber.open(pdf_path) as pdf:
             for i, page in enumerate(pdf.pages[:max_pages]):
@@ -39,57 +63,184 @@ class LegalPDFComparator:
             raise ValueError("One or both PDFs contain no extractable text.")
 
         print("🤖 Sending documents to Gemini for comparison...")
-        comparison_prompt = f"""
-        You are a meticulous legal and financial document comparison AI. Your audience values clarity and precision.
-        Compare the two documents provided and return ONLY a single, valid JSON object. Do not include any text before or after the JSON.
-
-        Document A:
-        ---
-        {text_a[:6000]}
-        ---
-
-        Document B:
-        ---
-        {text_b[:6000]}
-        ---
-
-        Instructions:
-        1. Identify at least 4-5 key legal or financial clauses/aspects present in the documents (e.g., Liability, Termination Clause, Payment Terms, Confidentiality).
-        2. For each aspect, provide a concise summary of each document's position in the comparison table.
-        3. List the distinct advantages for each document.
-        4. Determine which document is superior or more favorable overall and provide a clear, actionable reason.
-
-        Your response must be in this exact JSON format:
-        {{
-          "comparison_table": [
-            {{"aspect": "Clause Name", "document_a": "Summary of Document A's position.", "document_b": "Summary of Document B's position."}}
-          ],
-          "advantages_a": ["Advantage 1", "Advantage 2"],
-          "advantages_b": ["Advantage 1", "Advantage 2"],
-          "best_choice": "Document A",
-          "reasoning": "A concise explanation of why this document is the better choice."
-        }}
-        """
+        comparison_prompt = (
+            f"Document A:\n---\n{compact_text(text_a[:6000])}\n---\n"
+            f"Document B:\n---\n{compact_text(text_b[:6000])}\n---"
+        )
+        record_prompt_savings(COMPARE_TEMPLATE, len(text_a[:6000]) + len(text_b[:6000]),
+                              COMPARE_INSTRUCTION + comparison_prompt)
 
-        response = self.model.generate_content(comparison_prompt)
-        
+        # Stream the answer so a truncated tail still leaves us the completed table rows
+        self.gemini.rate_limiter.wait()
+        call_started = time.perf_counter()
+        response = self.gemini.generate(COMPARE_INSTRUCTION, comparison_prompt)
+        parser = IncrementalJSONParser()
+        stream_error = None
         try:
-            # Clean the response to only get the JSON part
-            response_text = response.text.strip()
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            if json_start != -1 and json_end != -1:
-                clean_json = response_text[json_start:json_end]
-                result = json.loads(clean_json)
-            else:
-                raise ValueError("No JSON object found in the response.")
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"Error parsing Gemini response: {e}")
-            print(f"Raw response was:\n{response.text}")
-            raise ValueError(f"Failed to parse Gemini response.")
+            for chunk_text in stream_text(response):
+                parser.feed(chunk_text)
+            record_model_call(response, time.perf_counter() - call_started)
+        except Exception as e:
+            print(f"⚠️ Comparison stream interrupted: {e}")
+            stream_error = e
+
+        result = parser.result()
+        if result is None:
+            rows = parser.items_for('comparison_table')
+            if not rows:
+                if stream_error:
+                    raise stream_error
+                print(f"Error parsing Gemini response: no JSON object found")
+                print(f"Raw response was:\n{parser.text}")
+                raise ValueError(f"Failed to parse Gemini response.")
+            print(f"⚠️ Gemini response was truncated; keeping {len(rows)} completed comparison rows")
+            result = {
+                'comparison_table': rows,
+                'advantages_a': [],
+                'advantages_b': [],
+                'best_choice': 'Undetermined',
+                'reasoning': 'The AI response was cut off before a recommendation was made. Review the comparison table above.',
+                'truncated': True
+            }
             
         # Add original filenames for display on the frontend
         result['filename_a'] = os.path.basename(pdf_a_path)
         result['filename_b'] = os.path.basename(pdf_b_path)
 
-        return result
\ No newline at end of file
+        return result
+
+    # ========================
+    # N-way comparison
+    # ========================
+    def document_profile(self, pdf_path: str, aspects: List[str] = None) -> Dict:
+        """
+        Summarize one document per aspect, with a favorability score
+
+        The profile is cached by file content hash, so each document costs
+        one model call however many comparisons it takes part in.
+
+        Args:
+            pdf_path (str): PDF to profile
+            aspects (List[str]): Aspects to cover (defaults to DEFAULT_ASPECTS)
+
+        Returns:
+            Dict: {"document_type", "aspects": {aspect: {"summary", "score"}}, "advantages"}
+        """
+        aspects = aspects or DEFAULT_ASPECTS
+        doc_hash = file_sha256(pdf_path)
+        cache_key = f"{self.gemini.model_name}:{'|'.join(aspects)}:{doc_hash}"
+        cached = self.cache.get("document_profile", cache_key)
+        if cached:
+            print(f"💾 Using cached profile for {os.path.basename(pdf_path)}")
+            return cached
+
+        text = self.extract_text(pdf_path)
+        if not text:
+            raise ValueError(f"{os.path.basename(pdf_path)} contains no extractable text.")
+
+        print(f"🤖 Profiling {os.path.basename(pdf_path)} with Gemini...")
+        aspect_lines = "\n".join(f"- {aspect}" for aspect in aspects)
+        profile_prompt = f"Document:\n---\n{compact_text(text[:6000])}\n---\nAspects:\n{aspect_lines}"
+        record_prompt_savings(PROFILE_TEMPLATE, len(text[:6000]) + len(aspect_lines),
+                              PROFILE_INSTRUCTION + profile_prompt)
+
+        self.gemini.rate_limiter.wait()
+        call_started = time.perf_counter()
+        response = self.gemini.generate(PROFILE_INSTRUCTION, profile_prompt)
+        parser = IncrementalJSONParser()
+        for chunk_text in stream_text(response):
+            parser.feed(chunk_text)
+        record_model_call(response, time.perf_counter() - call_started)
+
+        result = parser.result() or {}
+        rows = result.get("aspects") or parser.items_for("aspects")
+        if not rows:
+            raise ValueError(f"Failed to parse Gemini profile for {os.path.basename(pdf_path)}.")
+
+        by_aspect = {str(row.get("aspect", "")).strip().lower(): row for row in rows}
+        profile = {
+            "document_type": result.get("document_type", "Unknown"),
+            "aspects": {},
+            "advantages": result.get("advantages", [])
+        }
+        for aspect in aspects:
+            row = by_aspect.get(aspect.lower(), {})
+            try:
+                score = min(5.0, max(1.0, float(row.get("score", 3))))
+            except (TypeError, ValueError):
+                score = 3.0
+            profile["aspects"][aspect] = {
+                "summary": row.get("summary", "Not addressed"),
+                "score": score
+            }
+
+        # Only cache complete answers; a truncated stream is used once and retried next time
+        if parser.complete:
+            self.cache.set("document_profile", cache_key, profile, ttl=self.profile_ttl)
+        return profile
+
+    def compare_many(self, pdf_paths: List[str], filenames: List[str] = None, aspects: List[str] = None) -> Dict:
+        """
+        Compare any number of documents from their cached per-document profiles
+
+        Cost grows linearly with the number of documents: one profile per
+        document, then the matrix and ranking are built locally.
+
+        Args:
+            pdf_paths (List[str]): Two or more PDFs
+            filenames (List[str]): Display names (defaults to the file names)
+            aspects (List[str]): Aspects to compare on (defaults to DEFAULT_ASPECTS)
+
+        Returns:
+            Dict: comparison matrix (leaders are positions in filenames), ranking, best choice and reasoning
+        """
+        if len(pdf_paths) < 2:
+            raise ValueError("At least two documents are required for comparison.")
+        aspects = aspects or DEFAULT_ASPECTS
+        filenames = filenames or [os.path.basename(path) for path in pdf_paths]
+
+        print(f"📄 Profiling {len(pdf_paths)} documents...")
+        profiles = [self.document_profile(path, aspects) for path in pdf_paths]
+
+        comparison_matrix = []
+        for aspect in aspects:
+            entries = [profile["aspects"][aspect] for profile in profiles]
+            best_score = max(entry["score"] for entry in entries)
+            comparison_matrix.append({
+                "aspect": aspect,
+                "documents": [
+                    {"filename": name, "summary": entry["summary"], "score": entry["score"]}
+                    for name, entry in zip(filenames, entries)
+                ],
+                # Positions in filenames, so documents with the same display name stay distinct
+                "leaders": [index for index, entry in enumerate(entries) if entry["score"] == best_score]
+            })
+
+        ranking = []
+        for index, (name, profile) in enumerate(zip(filenames, profiles)):
+            scores = [profile["aspects"][aspect]["score"] for aspect in aspects]
+            ranking.append({
+                "filename": name,
+                "document_type": profile["document_type"],
+                "average_score": round(sum(scores) / len(scores), 2),
+                "aspects_led": [row["aspect"] for row in comparison_matrix if index in row["leaders"]],
+                "advantages": profile["advantages"],
+                "document_index": index
+            })
+        ranking.sort(key=lambda entry: (-entry["average_score"], -len(entry["aspects_led"]), entry["document_index"]))
+        for position, entry in enumerate(ranking, 1):
+            entry["rank"] = position
+
+        best = ranking[0]
+        led = ", ".join(best["aspects_led"]) or "no single aspect"
+        reasoning = (f"{best['filename']} has the highest average favorability score "
+                     f"({best['average_score']}/5 across {len(aspects)} aspects) and leads on {led}.")
+
+        return {
+            "aspects": aspects,
+            "comparison_matrix": comparison_matrix,
+            "ranking": ranking,
+            "best_choice": best["filename"],
+            "reasoning": reasoning,
+            "filenames": filenames
+        }
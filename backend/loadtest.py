@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+End-to-end HTTP load test
+=========================
+
+Starts the Flask app (gunicorn with gunicorn.conf.py, or the threaded dev
+server) wired to a local stand-in for the Gemini API, generates a corpus of
+contract PDFs, replays a mix of /analyze and /compare uploads at a fixed
+concurrency and reports latency percentiles, error rate, throughput and
+server RSS as JSON.
+
+Usage:
+    python loadtest.py --requests 200 --concurrency 8
+    python loadtest.py --server dev --compare-ratio 0.3 --output results.json
+    python loadtest.py --max-p99-ms 20000 --max-error-rate 0.01   # exit 1 if breached
+
+The stand-in answers every prompt with well-formed JSON after
+--model-latency seconds, so results measure the app itself (PDF parsing,
+rendering, queuing) rather than Gemini. Server RSS is read from /proc and is
+only reported on Linux.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CLAUSES = [
+    "The Supplier shall indemnify and hold harmless the Customer from any and all claims, losses and damages arising out of the Services, without limitation.",
+    "Either party may terminate this Agreement for convenience upon thirty (30) days written notice to the other party.",
+    "Payment shall be made within forty-five (45) days of receipt of a valid invoice. Late payments accrue interest at 1.5% per month.",
+    "The Customer waives any right to a jury trial and agrees to binding arbitration in a venue selected solely by the Supplier.",
+    "Each party shall keep confidential all information disclosed by the other party and use it only for the purposes of this Agreement.",
+    "This Agreement shall be governed by and construed in accordance with the laws of the State of New York.",
+    "In no event shall the Supplier's aggregate liability exceed the fees paid by the Customer in the twelve (12) months preceding the claim.",
+    "The Supplier may change the fees at any time without notice, and continued use of the Services constitutes acceptance of the new fees.",
+    "All intellectual property created under this Agreement shall vest exclusively in the Customer upon full payment.",
+    "A penalty of ten percent (10%) of the contract value shall be payable for each week of delay in delivery.",
+]
+
+
+# ========================
+# Gemini stand-in
+# ========================
+def _fake_answer(prompt: str) -> str:
+    """Deterministic, well-formed answer for each prompt type the backend sends"""
+    clause_ids = re.findall(r'^\[(\d+)\] ', prompt, re.M)
+    if clause_ids:
+        levels = ['RED', 'YELLOW', 'GREEN']
+        return json.dumps({'classifications': [
+            {'clause_id': int(cid), 'risk_level': levels[zlib.crc32((cid + prompt[-40:]).encode('utf-8')) % 3],
+             'reasoning': 'Stand-in classification for load testing.'}
+            for cid in clause_ids
+        ]})
+    if 'Document A:' in prompt:
+        return json.dumps({
+            'comparison_table': [
+                {'aspect': aspect, 'document_a': 'Position of A.', 'document_b': 'Position of B.'}
+                for aspect in ('Liability', 'Termination', 'Payment Terms', 'Confidentiality')
+            ],
+            'advantages_a': ['Shorter payment terms'],
+            'advantages_b': ['Capped liability'],
+            'best_choice': 'Document B',
+            'reasoning': 'Stand-in comparison for load testing.'
+        })
+    if '\nAspects:\n' in prompt:
+        aspects = re.findall(r'^- (.+)$', prompt.split('\nAspects:\n')[-1], re.M)
+        return json.dumps({
+            'document_type': 'Stand-in agreement',
+            'aspects': [
+                {'aspect': aspect, 'summary': 'Stand-in position for load testing.',
+                 'score': 1 + zlib.crc32((aspect + prompt[:200]).encode('utf-8')) % 5}
+                for aspect in aspects
+            ],
+            'advantages': ['Stand-in advantage']
+        })
+    return 'This is a stand-in summary of the document produced for load testing.'
+
+
+def _response_json(text: str, prompt: str, generated: str = None) -> Dict:
+    """One response (or stream chunk); `generated` is everything produced so far, as Gemini's usage counts are cumulative"""
+    generated = text if generated is None else generated
+    return {
+        'candidates': [{
+            'content': {'parts': [{'text': text}], 'role': 'model'},
+            'finishReason': 'STOP',
+            'index': 0
+        }],
+        'usageMetadata': {
+            'promptTokenCount': len(prompt) // 4,
+            'candidatesTokenCount': len(generated) // 4,
+            'totalTokenCount': (len(prompt) + len(generated)) // 4
+        }
+    }
+
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    """Implements generateContent and streamGenerateContent of the Gemini REST API"""
+
+    latency = 0.5
+    calls = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        prompt = '\n'.join(
+            part.get('text', '')
+            for content in body.get('contents', [])
+            for part in content.get('parts', [])
+        )
+        # System instructions are billed as prompt tokens too
+        instruction = ''.join(part.get('text', '') for part in (body.get('systemInstruction') or {}).get('parts', []))
+        with FakeModelHandler.lock:
+            FakeModelHandler.calls += 1
+        time.sleep(self.latency)
+
+        text = _fake_answer(prompt)
+        if ':streamGenerateContent' in self.path:
+            # REST server streaming is a JSON array of partial responses
+            size = max(len(text) // 3, 1)
+            payload = json.dumps([
+                _response_json(text[i:i + size], instruction + prompt, generated=text[:i + size])
+                for i in range(0, len(text), size)
+            ])
+        else:
+            payload = json.dumps(_response_json(text, instruction + prompt))
+
+        data = payload.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_model(port: int, latency: float) -> ThreadingHTTPServer:
+    FakeModelHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeModelHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ========================
+# Corpus
+# ========================
+def generate_corpus(directory: str, count: int, min_pages: int, max_pages: int, seed: int) -> List[str]:
+    """Write `count` contract-like PDFs with random clause mixes"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer
+
+    rng = random.Random(seed)
+    styles = getSampleStyleSheet()
+    paths = []
+    for n in range(count):
+        path = os.path.join(directory, f"contract_{n:03d}.pdf")
+        story = [Paragraph(f"Services Agreement No. {n}", styles['Title'])]
+        for page in range(rng.randint(min_pages, max_pages)):
+            if page:
+                story.append(PageBreak())
+            for section in range(rng.randint(3, 6)):
+                clause = rng.choice(CLAUSES).replace('Agreement', f'Agreement {n}-{page}-{section}', 1)
+                story.append(Paragraph(f"{page + 1}.{section + 1} {clause}", styles['Normal']))
+                story.append(Spacer(1, 18))
+        SimpleDocTemplate(path, pagesize=letter).build(story)
+        paths.append(path)
+    return paths
+
+
+# ========================
+# Server under test
+# ========================
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(mode: str, port: int, env: Dict[str, str], workers: int, log_path: str) -> subprocess.Popen:
+    if mode == 'gunicorn':
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+               '--bind', f'127.0.0.1:{port}', '--workers', str(workers), 'app:app']
+    else:
+        cmd = [sys.executable, '-c', f"from app import app; app.run(port={port}, threaded=True)"]
+    with open(log_path, 'w') as log:
+        return subprocess.Popen(cmd, cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+                                start_new_session=True)
+
+
+def wait_for_app(base_url: str, timeout: float = 60.0):
+    """Wait until the app answers HTTP (gunicorn's master listens before its workers are forked)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/metrics', timeout=1):
+                return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"App did not answer at {base_url} within {timeout:.0f}s")
+
+
+def tree_rss_mb(pid: int) -> float:
+    """Resident memory of a process and all its descendants (Linux /proc only)"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    total_kb = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+# ========================
+# Client
+# ========================
+def multipart_body(files: Dict[str, str]):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for field, path in files.items():
+        with open(path, 'rb') as f:
+            content = f.read()
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+            f'filename="{os.path.basename(path)}"\r\nContent-Type: application/pdf\r\n\r\n'.encode('utf-8')
+            + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def send(base_url: str, endpoint: str, files: Dict[str, str], timeout: float) -> Dict:
+    body, content_type = multipart_body(files)
+    req = urllib.request.Request(f'{base_url}{endpoint}', data=body, method='POST',
+                                 headers={'Content-Type': content_type})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0  # connection error or timeout
+    return {'endpoint': endpoint, 'status': status, 'latency_ms': (time.perf_counter() - started) * 1000}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def latency_stats(samples: List[Dict]) -> Dict:
+    latencies = [s['latency_ms'] for s in samples]
+    errors = [s for s in samples if s['status'] != 200]
+    return {
+        'requests': len(samples),
+        'errors': len(errors),
+        'error_rate': round(len(errors) / len(samples), 4) if samples else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p90_ms': round(percentile(latencies, 90), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'max_ms': round(max(latencies), 1) if latencies else 0.0,
+        'mean_ms': round(statistics.fmean(latencies), 1) if latencies else 0.0
+    }
+
+
+def run(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix='ledo-loadtest-')
+    model_port = free_port()
+    app_port = free_port()
+    fake_model = start_fake_model(model_port, args.model_latency)
+
+    print(f"📄 Generating {args.documents} test PDFs...", file=sys.stderr)
+    corpus = generate_corpus(workdir, args.documents, args.min_pages, args.max_pages, args.seed)
+
+    env = dict(os.environ)
+    env.update({
+        'GEMINI_API_KEY': 'loadtest',
+        'GEMINI_TRANSPORT': 'rest',
+        'GEMINI_API_ENDPOINT': f'http://127.0.0.1:{model_port}',
+        'GEMINI_MIN_INTERVAL': str(args.model_min_interval),
+        'SHARED_STATE_DB': os.path.join(workdir, 'shared_state.sqlite3'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        # Stand-in results must not end up in the real search index or tile cache
+        'CLAUSE_INDEX_DB': os.path.join(workdir, 'clause_index.sqlite3'),
+        'TILE_CACHE_DIR': os.path.join(workdir, 'tiles'),
+        'CLIENT_QUOTA': '0',
+    })
+    server_log = os.path.join(workdir, 'server.log')
+    server = start_app(args.server, app_port, env, args.workers, server_log)
+    base_url = f'http://127.0.0.1:{app_port}'
+
+    rss_samples = []
+    stop_sampling = threading.Event()
+
+    def sample_rss():
+        while not stop_sampling.is_set():
+            rss_samples.append(tree_rss_mb(server.pid))
+            stop_sampling.wait(0.5)
+
+    try:
+        try:
+            wait_for_app(base_url)
+        except RuntimeError:
+            with open(server_log) as f:
+                print(f.read()[-4000:], file=sys.stderr)
+            raise
+        print(f"🚀 {args.server} app on {base_url}; Gemini stand-in on port {model_port}", file=sys.stderr)
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+
+        rng = random.Random(args.seed)
+        jobs = []
+        for _ in range(args.requests):
+            if rng.random() < args.compare_ratio:
+                a, b = rng.sample(corpus, 2)
+                jobs.append(('/compare', {'file1': a, 'file2': b}))
+            else:
+                jobs.append(('/analyze', {'file': rng.choice(corpus)}))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            samples = list(pool.map(lambda job: send(base_url, job[0], job[1], args.timeout), jobs))
+        duration = time.perf_counter() - started
+    finally:
+        stop_sampling.set()
+        os.killpg(server.pid, signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(server.pid, signal.SIGKILL)
+        fake_model.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ok = [s for s in samples if s['status'] == 200]
+    status_counts = {}
+    for s in samples:
+        status_counts[str(s['status'])] = status_counts.get(str(s['status']), 0) + 1
+
+    return {
+        'config': {
+            'server': args.server,
+            'workers': args.workers if args.server == 'gunicorn' else 1,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'compare_ratio': args.compare_ratio,
+            'documents': args.documents,
+            'pages': [args.min_pages, args.max_pages],
+            'model_latency_s': args.model_latency,
+            'model_min_interval_s': args.model_min_interval
+        },
+        'duration_s': round(duration, 2),
+        'throughput_rps': round(len(ok) / duration, 3) if duration else 0.0,
+        'uploads_per_minute': round(len(ok) / duration * 60, 1) if duration else 0.0,
+        'model_calls': FakeModelHandler.calls,
+        'status_counts': status_counts,
+        'overall': latency_stats(samples),
+        'by_endpoint': {
+            endpoint: latency_stats([s for s in samples if s['endpoint'] == endpoint])
+            for endpoint in ('/analyze', '/compare')
+            if any(s['endpoint'] == endpoint for s in samples)
+        },
+        'server_rss_mb': {
+            'peak': round(max(rss_samples), 1) if rss_samples else None,
+            'mean': round(statistics.fmean(rss_samples), 1) if rss_samples else None
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Flask app against a local Gemini stand-in")
+    parser.add_argument('--server', choices=['gunicorn', 'dev'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--compare-ratio', type=float, default=0.2, help="fraction of requests sent to /compare")
+    parser.add_argument('--documents', type=int, default=12, help="PDFs in the generated corpus")
+    parser.add_argument('--min-pages', type=int, default=1)
+    parser.add_argument('--max-pages', type=int, default=8)
+    parser.add_argument('--model-latency', type=float, default=0.5, help="seconds the stand-in waits per call")
+    parser.add_argument('--model-min-interval', type=float, default=0.0, help="GEMINI_MIN_INTERVAL for the app")
+    parser.add_argument('--timeout', type=float, default=300.0, help="per-request client timeout")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help="also write the JSON report to this file")
+    parser.add_argument('--max-p99-ms', type=float, help="fail if overall p99 latency exceeds this")
+    parser.add_argument('--max-error-rate', type=float, help="fail if the error rate exceeds this fraction")
+    parser.add_argument('--min-throughput', type=float, help="fail if successful requests/second is below this")
+    args = parser.parse_args()
+
+    report = run(args)
+    failures = []
+    if args.max_p99_ms is not None and report['overall']['p99_ms'] > args.max_p99_ms:
+        failures.append(f"p99 {report['overall']['p99_ms']} ms > {args.max_p99_ms} ms")
+    if args.max_error_rate is not None and report['overall']['error_rate'] > args.max_error_rate:
+        failures.append(f"error rate {report['overall']['error_rate']} > {args.max_error_rate}")
+    if args.min_throughput is not None and report['throughput_rps'] < args.min_throughput:
+        failures.append(f"throughput {report['throughput_rps']} rps < {args.min_throughput} rps")
+    report['failures'] = failures
+    report['passed'] = not failures
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Compact prompts for Gemini
+==========================
+
+Instructions are written readably below and minified once at import
+(indentation, blank lines and the whitespace inside the JSON examples are
+dropped). Where the backend supports it they are sent as the model's system
+instruction, so each request body only carries the clauses or documents.
+Clauses are sent as "[id] text" lines instead of "Clause id: text" blocks.
+
+Every call reports how many characters compaction kept out of the prompt
+compared with the readable template and the old clause format; the
+estimated tokens saved end up in the request's resource usage counts.
+"""
+
+import os
+import re
+import textwrap
+from typing import List
+
+from resource_accounting import add_count
+
+# GEMINI_SYSTEM_INSTRUCTION=0 inlines the instruction for models without system instruction support
+USE_SYSTEM_INSTRUCTION = os.getenv('GEMINI_SYSTEM_INSTRUCTION', '1') != '0'
+
+# Rough size of a Gemini token for English text, used only to report savings
+CHARS_PER_TOKEN = 4
+
+# Bump when an instruction changes meaningfully, so cached classifications are not reused
+CLASSIFY_PROMPT_VERSION = 2
+
+
+def minify_prompt(text: str) -> str:
+    """Strip indentation and blank lines, and join JSON example lines"""
+    lines = [line.strip() for line in textwrap.dedent(text).splitlines()]
+    text = '\n'.join(line for line in lines if line)
+    # No line breaks right inside brackets or after commas of the JSON examples
+    text = re.sub(r'(?<=[\[{])\n|\n(?=[\]}])', '', text)
+    return text.replace(',\n', ', ')
+
+
+def compact_text(text: str) -> str:
+    """Collapse runs of spaces and blank lines in extracted PDF text"""
+    text = re.sub(r'[ \t\u00a0]+', ' ', text)
+    return re.sub(r'\s*\n\s*', '\n', text).strip()
+
+
+def prompt_contents(instruction: str, content: str) -> str:
+    """Request body for a model built with model_for(instruction)"""
+    if USE_SYSTEM_INSTRUCTION:
+        return content
+    return f"{instruction}\n\n{content}"
+
+
+def record_prompt_savings(template: str, legacy_content_chars: int, sent: str) -> int:
+    """
+    Record how much smaller a prompt is than its uncompacted form
+
+    Args:
+        template (str): The readable instruction template
+        legacy_content_chars (int): Size of the variable part in the old format
+        sent (str): Instruction plus content actually sent (the system instruction is billed too)
+
+    Returns:
+        int: Estimated tokens saved
+    """
+    saved = max(0, (len(template) + legacy_content_chars - len(sent)) // CHARS_PER_TOKEN)
+    add_count('prompt_tokens_saved_est', saved)
+    return saved
+
+
+# ========================
+# Clause classification
+# ========================
+CLASSIFY_TEMPLATE = """
+        You are a legal risk assessment AI. Classify each contract clause as:
+        - RED: highly dangerous/risky (severe penalties, unfair terms, major liabilities)
+        - YELLOW: moderate risk (standard terms with some concerns)
+        - GREEN: safe (standard, favorable or neutral terms)
+        Clauses are given one per line as "[id] text".
+        Return only JSON in this exact format:
+        {
+            "classifications": [
+                {
+                    "clause_id": 0,
+                    "risk_level": "RED|YELLOW|GREEN",
+                    "reasoning": "Brief explanation"
+                }
+            ]
+        }
+        """
+CLASSIFY_INSTRUCTION = minify_prompt(CLASSIFY_TEMPLATE)
+
+
+def clause_batch_prompt(texts: List[str]) -> str:
+    """Clauses of one batch as ID-tagged lines"""
+    return '\n'.join(f"[{idx}] {' '.join(text.split())}" for idx, text in enumerate(texts))
+
+
+def legacy_clause_batch_chars(texts: List[str]) -> int:
+    """Size of the same batch in the old "Clause N: text" format"""
+    return len("\n\nAnalyze these clauses:\n\n") + sum(
+        len(f"Clause {idx}: {text}\n\n") for idx, text in enumerate(texts)
+    )
+
+
+# ========================
+# Document summary
+# ========================
+SUMMARY_TEMPLATE = """
+            Please provide a clear, simple summary of the legal document you are given in 2-3 paragraphs that a non-lawyer can understand.
+            Focus on:
+            1. What type of document this is
+            2. Main purpose and key terms
+            3. Important obligations or rights
+
+            Write in simple, plain English avoiding legal jargon.
+            """
+SUMMARY_INSTRUCTION = minify_prompt(SUMMARY_TEMPLATE)
+
+
+# ========================
+# Document comparison
+# ========================
+COMPARE_TEMPLATE = """
+        You are a meticulous legal and financial document comparison AI. Your audience values clarity and precision.
+        Compare the two documents provided (Document A and Document B) and return ONLY a single, valid JSON object. Do not include any text before or after the JSON.
+
+        Instructions:
+        1. Identify at least 4-5 key legal or financial clauses/aspects present in the documents (e.g., Liability, Termination Clause, Payment Terms, Confidentiality).
+        2. For each aspect, provide a concise summary of each document's position in the comparison table.
+        3. List the distinct advantages for each document.
+        4. Determine which document is superior or more favorable overall and provide a clear, actionable reason.
+
+        Your response must be in this exact JSON format:
+        {
+          "comparison_table": [
+            {"aspect": "Clause Name", "document_a": "Summary of Document A's position.", "document_b": "Summary of Document B's position."}
+          ],
+          "advantages_a": ["Advantage 1", "Advantage 2"],
+          "advantages_b": ["Advantage 1", "Advantage 2"],
+          "best_choice": "Document A",
+          "reasoning": "A concise explanation of why this document is the better choice."
+        }
+        """
+COMPARE_INSTRUCTION = minify_prompt(COMPARE_TEMPLATE)
+
+PROFILE_TEMPLATE = """
+        You are a meticulous legal and financial document analyst.
+        Summarize the document you are given for a side-by-side comparison with similar documents and return ONLY a single, valid JSON object.
+
+        For each aspect listed after the document, give a one or two sentence summary of the document's position
+        and a favorability score from 1 (very unfavorable to the signing party) to 5 (very favorable).
+        If the document does not address an aspect, say "Not addressed" and score it 3.
+
+        Your response must be in this exact JSON format:
+        {
+          "document_type": "Short description of the document",
+          "aspects": [
+            {"aspect": "Aspect name", "summary": "Position of the document.", "score": 3}
+          ],
+          "advantages": ["Advantage 1", "Advantage 2"]
+        }
+        """
+PROFILE_INSTRUCTION = minify_prompt(PROFILE_TEMPLATE)
@@ -0,0 +1,272 @@
+"""
+Per-request resource accounting
+===============================
+
+Records, for every analysis or comparison, wall and CPU time per stage,
+peak traced memory (tracemalloc, opt-in), RSS growth, page/clause counts and the
+prompt/response tokens of each Gemini call. The usage of the request being
+handled is kept in a context variable, so code deep in the pipeline (e.g.
+classify_text) can report model calls without any extra arguments.
+
+The most expensive requests of all workers are kept in an
+ExpensiveRequestLog in the shared SQLite state to spot pathological PDFs.
+"""
+
+import contextvars
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from shared_state import connect, shared_db_path
+
+_current_usage = contextvars.ContextVar('resource_usage', default=None)
+
+# tracemalloc slows allocation-heavy code several times over, so RESOURCE_TRACE_MEMORY=1 opts in
+TRACE_MEMORY = os.getenv('RESOURCE_TRACE_MEMORY', '0') == '1'
+
+_tracing_lock = threading.Lock()
+_tracked_requests = 0
+
+
+def _rss_bytes() -> int:
+    """Current resident set size (falls back to peak RSS where /proc is missing)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if os.uname().sysname == 'Darwin' else maxrss * 1024
+
+
+class ResourceUsage:
+    """Resource usage of one request, filled in as the pipeline runs"""
+
+    def __init__(self, kind: str, label: str = None):
+        self.kind = kind
+        self.label = label
+        self.stages = {}
+        self.model_calls = []
+        self.counts = {}
+        self.peak_shared = False
+        self._current_stage = None
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        self._rss_start = _rss_bytes()
+        self._traced_start = 0
+        self._result = None
+
+    def _start_tracing(self):
+        global _tracked_requests
+        if not TRACE_MEMORY:
+            return
+        with _tracing_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # The traced peak is process-wide; it is only exact when no other request overlaps
+            if _tracked_requests == 0:
+                tracemalloc.reset_peak()
+            else:
+                self.peak_shared = True
+            _tracked_requests += 1
+            self._traced_start = tracemalloc.get_traced_memory()[0]
+
+    def _stop_tracing(self) -> Optional[int]:
+        global _tracked_requests
+        if not TRACE_MEMORY:
+            return None
+        with _tracing_lock:
+            peak = tracemalloc.get_traced_memory()[1]
+            _tracked_requests -= 1
+            if _tracked_requests > 0:
+                self.peak_shared = True
+            else:
+                # Only trace while a request is measured, not during idle time or untracked routes
+                tracemalloc.stop()
+            return max(0, peak - self._traced_start)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a pipeline stage (wall and CPU)"""
+        previous = self._current_stage
+        self._current_stage = name
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'wall_ms': 0.0, 'cpu_ms': 0.0})
+            entry['wall_ms'] += (time.perf_counter() - wall_start) * 1000
+            entry['cpu_ms'] += (time.thread_time() - cpu_start) * 1000
+            self._current_stage = previous
+
+    def record_model_call(self, prompt_tokens: int, response_tokens: int, seconds: float):
+        self.model_calls.append({
+            'stage': self._current_stage,
+            'prompt_tokens': prompt_tokens,
+            'response_tokens': response_tokens,
+            'seconds': round(seconds, 3)
+        })
+
+    def set_count(self, name: str, value: int):
+        self.counts[name] = value
+
+    def add_count(self, name: str, value: int):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def finish(self) -> Dict[str, any]:
+        """Close the record and return it as a JSON-serializable dict"""
+        if self._result is not None:
+            return self._result
+        peak_traced = self._stop_tracing()
+        self._result = {
+            'kind': self.kind,
+            'label': self.label,
+            'finished_at': time.time(),
+            'wall_ms': round((time.perf_counter() - self._wall_start) * 1000, 1),
+            'cpu_ms': round((time.thread_time() - self._cpu_start) * 1000, 1),
+            'peak_traced_mb': round(peak_traced / (1024 * 1024), 2) if peak_traced is not None else None,
+            'peak_traced_shared': self.peak_shared,
+            'rss_delta_mb': round((_rss_bytes() - self._rss_start) / (1024 * 1024), 2),
+            'stages': {
+                name: {key: round(value, 1) for key, value in entry.items()}
+                for name, entry in self.stages.items()
+            },
+            'counts': dict(self.counts),
+            'model_calls': len(self.model_calls),
+            'prompt_tokens': sum(call['prompt_tokens'] for call in self.model_calls),
+            'response_tokens': sum(call['response_tokens'] for call in self.model_calls),
+            'model_call_details': list(self.model_calls)
+        }
+        return self._result
+
+    def summary(self) -> Dict[str, any]:
+        """Compact form for a response header (no per-call details)"""
+        result = self.finish()
+        return {key: value for key, value in result.items() if key not in ('model_call_details', 'finished_at')}
+
+
+@contextmanager
+def track(kind: str, label: str = None):
+    """Account for everything done in the with-block as one request"""
+    usage = ResourceUsage(kind, label)
+    usage._start_tracing()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        usage.finish()
+        _current_usage.reset(token)
+
+
+def current_usage() -> Optional[ResourceUsage]:
+    return _current_usage.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Time a stage of the current request; a no-op outside track()"""
+    usage = _current_usage.get()
+    if usage is None:
+        yield
+        return
+    with usage.stage(name):
+        yield
+
+
+def set_label(label: str):
+    """Name the current request in the expensive-request log (e.g. the uploaded file)"""
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.label = label
+
+
+def set_count(name: str, value: int):
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.set_count(name, value)
+
+
+def add_count(name: str, value: int):
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.add_count(name, value)
+
+
+def record_model_call(response, seconds: float):
+    """
+    Record the token usage of a Gemini response for the current request
+
+    For streamed responses call this after the stream has been consumed,
+    when usage_metadata has been filled in.
+    """
+    usage = _current_usage.get()
+    if usage is None:
+        return
+    metadata = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(metadata, 'prompt_token_count', 0) or 0
+    response_tokens = getattr(metadata, 'candidates_token_count', 0) or 0
+    usage.record_model_call(prompt_tokens, response_tokens, seconds)
+
+
+class ExpensiveRequestLog:
+    """
+    The N most expensive requests (by wall time) of the last `window` seconds, across all workers
+
+    Records are kept in the shared SQLite state, so they survive worker
+    recycling and every worker reports the same list.
+    """
+
+    def __init__(self, max_entries: int = 20, window: float = 24 * 3600, db_path: str = None):
+        self.max_entries = max_entries
+        self.window = window
+        self.db_path = db_path or shared_db_path()
+        conn = connect(self.db_path)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS expensive_requests (
+                    id INTEGER PRIMARY KEY,
+                    wall_ms REAL NOT NULL,
+                    finished_at REAL NOT NULL,
+                    data TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS expensive_requests_wall ON expensive_requests (wall_ms)")
+        finally:
+            conn.close()
+
+    def add(self, record: Dict[str, any]):
+        """Keep the record if it is among the most expensive of the window"""
+        record = dict(record, pid=os.getpid())
+        conn = connect(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM expensive_requests WHERE finished_at < ?", (time.time() - self.window,))
+            conn.execute(
+                "INSERT INTO expensive_requests (wall_ms, finished_at, data) VALUES (?, ?, ?)",
+                (record['wall_ms'], record['finished_at'], json.dumps(record))
+            )
+            conn.execute(
+                "DELETE FROM expensive_requests WHERE id NOT IN "
+                "(SELECT id FROM expensive_requests ORDER BY wall_ms DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def top(self) -> List[Dict[str, any]]:
+        """Most expensive first"""
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT data FROM expensive_requests WHERE finished_at >= ? ORDER BY wall_ms DESC LIMIT ?",
+                (time.time() - self.window, self.max_entries)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [json.loads(data) for data, in rows]
@@ -0,0 +1,54 @@
+"""
+Risk-first classification order
+===============================
+
+classify_text() used to send clauses to Gemini in document order, so a
+dangerous clause near the end of a long contract was classified last.
+This module scores each clause with a cheap keyword heuristic (liability,
+indemnity, termination, penalties, waivers, ...) so the likely-risky ones
+can be sent in the first batches. Only the order of model calls changes;
+classifications are attached to the original blocks, so results stay in
+document order.
+"""
+
+import re
+from typing import Dict, List
+
+# Weight of each risk signal; a clause scores the sum of the distinct signals it contains
+RISK_TERMS = {
+    r'indemn\w*|hold\s+harmless': 5,
+    r'liabilit\w*|liable': 4,
+    r'penalt\w*|liquidated\s+damages|forfeit\w*': 4,
+    r'waive\w*|waiver': 4,
+    r'terminat\w*': 3,
+    r'unlimited|uncapped|irrevocabl\w*': 3,
+    r'sole\s+(?:and\s+absolute\s+)?discretion': 3,
+    r'consequential|punitive': 3,
+    r'exclusiv\w*|non-?compet\w*|non-?solicit\w*': 2,
+    r'automatic(?:ally)?\s+renew\w*': 2,
+    r'arbitrat\w*|jurisdiction': 1,
+    r'without\s+(?:prior\s+)?notice': 2,
+    r'interest|late\s+fee\w*': 1,
+}
+
+_RISK_PATTERNS = [(re.compile(rf'\b(?:{pattern})', re.I), weight) for pattern, weight in RISK_TERMS.items()]
+
+
+def risk_score(text: str) -> int:
+    """Heuristic risk score of a clause (0 when no risk term appears)"""
+    return sum(weight for pattern, weight in _RISK_PATTERNS if pattern.search(text))
+
+
+def prioritize_blocks(text_blocks: List[Dict[str, any]]) -> List[Dict[str, any]]:
+    """
+    Order blocks for classification, highest heuristic risk first
+
+    The sort is stable, so blocks with the same score keep their document order.
+
+    Args:
+        text_blocks (List[Dict]): Blocks still to be classified
+
+    Returns:
+        List[Dict]: The same block objects in classification order
+    """
+    return sorted(text_blocks, key=lambda block: -risk_score(block['text']))
@@ -0,0 +1,166 @@
+"""
+Structure-aware clause segmentation
+===================================
+
+Splits the words of a page into clauses using the document's own
+structure instead of vertical gaps alone:
+
+- section numbering at the start of a line after a finished sentence
+  (1., 1.1, 2.3.1, (a), (iv), a), "Article 5", "Section 2") starts a new clause
+- headings (larger or bold font, or short all-caps lines) start a new
+  clause and are kept with the text that follows them
+- paragraph gaps are measured against the page's own line pitch, and a
+  change of indentation after a finished sentence starts a new paragraph
+- list items ("(a) ...;", "ii) ...") stay with the lead-in sentence that
+  introduces them ("... including:"), so the model sees them in context
+- over-long clauses are cut at the next sentence boundary (a long list
+  continues in a new clause)
+
+Table-of-contents entries, bare page numbers and heading-only fragments are
+not sent to the model. Words must come from
+page.extract_words(extra_attrs=['size', 'fontname']).
+"""
+
+import re
+import statistics
+from typing import Dict, List
+
+# Clauses longer than this are cut at the next line that ends a sentence
+MAX_CLAUSE_CHARS = 1200
+# Shorter clauses carry no risk worth a model call (e.g. "Page 3", signature captions)
+MIN_CLAUSE_CHARS = 20
+
+NUMBERING = re.compile(
+    r'^(?:(?:article|section|clause)\s+[\divxlc]+[.:]?'
+    r'|\d+(?:\.\d+)+\.?'         # 1.1, 2.3.1
+    r'|\d+[.)]'                  # 1. 2)
+    r'|\((?:\d+|[a-z]|[ivxlc]+)\)'  # (1) (a) (iv)
+    r'|[a-z]\))\s',              # a)
+    re.I
+)
+LIST_ITEM = re.compile(r'^(?:\((?:\d+|[a-z]|[ivxlc]+)\)|(?:\d+|[a-z]|[ivxlc]+)\))\s', re.I)
+# A sentence that introduces a list: "... including:", "... as follows:"
+LEAD_IN = re.compile(r':["\')\]]?$')
+# A list item that the next item continues ("...;", "...; and", "..., or")
+ITEM_CONTINUES = re.compile(r'(?:[;,]|\b(?:and|or))$', re.I)
+SENTENCE_END = re.compile(r'[.;:!?]["\')\]]?$')
+TOC_ENTRY = re.compile(r'(?:\.\s?){4,}\s*\d+$')
+PAGE_NUMBER = re.compile(r'^(?:page\s+)?\d+(?:\s*(?:of|/)\s*\d+)?$|^-\s*\d+\s*-$', re.I)
+BOLD_FONT = re.compile(r'bold|black|heavy|semibold|demi', re.I)
+
+
+def _group_lines(words: List[Dict]) -> List[Dict]:
+    """Join words sharing a baseline into lines with their font cues"""
+    lines = []
+    for word in sorted(words, key=lambda w: (round(w['top']), w['x0'])):
+        size = word.get('size') or 0
+        line = lines[-1] if lines else None
+        if line and abs(word['top'] - line['top']) <= max(2.0, size * 0.3):
+            line['words'].append(word)
+        else:
+            lines.append({'top': word['top'], 'words': [word]})
+
+    for line in lines:
+        line_words = sorted(line['words'], key=lambda w: w['x0'])
+        text = ' '.join(' '.join(w['text'].split()) for w in line_words).strip()
+        chars = [(len(w['text']), w.get('size') or 0, bool(BOLD_FONT.search(w.get('fontname') or ''))) for w in line_words]
+        total = sum(n for n, _, _ in chars) or 1
+        line.update({
+            'text': text,
+            'bbox': [min(w['x0'] for w in line_words), min(w['top'] for w in line_words),
+                     max(w['x1'] for w in line_words), max(w['bottom'] for w in line_words)],
+            'size': max(size for _, size, _ in chars),
+            'bold': sum(n for n, _, bold in chars if bold) / total > 0.6
+        })
+    return [line for line in lines if line['text']]
+
+
+def _is_heading(line: Dict, body_size: float) -> bool:
+    text = line['text']
+    if len(text) > 100 or (SENTENCE_END.search(text) and not NUMBERING.match(text + ' ')):
+        return False
+    if body_size and line['size'] >= body_size * 1.15:
+        return True
+    letters = [c for c in text if c.isalpha()]
+    return line['bold'] or (len(letters) >= 4 and all(c.isupper() for c in letters) and len(text) <= 60)
+
+
+def segment_page(words: List[Dict], max_chars: int = MAX_CLAUSE_CHARS,
+                 min_chars: int = MIN_CLAUSE_CHARS) -> List[Dict]:
+    """
+    Split the words of one page into clauses
+
+    Args:
+        words (List[Dict]): pdfplumber words with 'size' and 'fontname' attributes
+        max_chars (int): Cut clauses longer than this at a sentence boundary
+        min_chars (int): Drop clauses shorter than this
+
+    Returns:
+        List[Dict]: Clauses in reading order, each {'text', 'bbox'}
+    """
+    lines = [
+        line for line in _group_lines(words)
+        if not TOC_ENTRY.search(line['text']) and not PAGE_NUMBER.match(line['text'])
+    ]
+    if not lines:
+        return []
+
+    # Page-relative measures: body font size and line pitch
+    sizes = [line['size'] for line in lines if line['size']]
+    body_size = statistics.median(sizes) if sizes else 0
+    pitches = [b['top'] - a['top'] for a, b in zip(lines, lines[1:]) if b['top'] > a['top']]
+    # Lower quartile: single-line paragraphs must not make paragraph spacing look like line spacing
+    pitch = sorted(pitches)[len(pitches) // 4] if pitches else 0
+
+    clauses = []
+    current = None
+    previous = None
+    for line in lines:
+        if current is None:
+            heading = _is_heading(line, body_size)
+            boundary = True
+        else:
+            prev_ended = bool(SENTENCE_END.search(previous['text']))
+            gap = bool(pitch) and line['top'] - previous['top'] > pitch * 1.2
+            # Headings only follow a finished sentence or a gap (not an all-caps line mid-paragraph)
+            heading = (prev_ended or gap or current['heading_only']) and _is_heading(line, body_size)
+            if current['heading_only']:
+                # A heading stays with what follows it, unless that is a separate heading (e.g. title, then section)
+                boundary = heading and gap
+            elif ((current['list'] or ITEM_CONTINUES.search(previous['text']))
+                  and LIST_ITEM.match(line['text'] + ' ') and len(current['text']) < max_chars):
+                # The next item of a list keeps its lead-in (or, at the top of a page, the items
+                # before it), whatever its spacing and indentation
+                heading = boundary = False
+            else:
+                numbered = bool(NUMBERING.match(line['text'] + ' '))
+                shifted = abs(line['bbox'][0] - previous['bbox'][0]) > 3
+                boundary = (
+                    heading
+                    or gap
+                    or (numbered and prev_ended)
+                    # First-line indent of a new paragraph, or the end of an indented list
+                    or (prev_ended and shifted)
+                    or (prev_ended and len(current['text']) >= max_chars)
+                )
+        if boundary:
+            # A long list cut at max_chars carries on in the next clause
+            continues_list = bool(current and current['list'] and LIST_ITEM.match(line['text'] + ' '))
+            if current:
+                clauses.append(current)
+            current = {'text': line['text'], 'bbox': list(line['bbox']), 'heading_only': heading,
+                       'list': continues_list or bool(LEAD_IN.search(line['text']))}
+        else:
+            current['text'] += ' ' + line['text']
+            current['bbox'] = [min(current['bbox'][0], line['bbox'][0]), min(current['bbox'][1], line['bbox'][1]),
+                               max(current['bbox'][2], line['bbox'][2]), max(current['bbox'][3], line['bbox'][3])]
+            current['heading_only'] = current['heading_only'] and heading
+            current['list'] = current['list'] or bool(LEAD_IN.search(line['text']))
+        previous = line
+    clauses.append(current)
+
+    return [
+        {'text': clause['text'], 'bbox': clause['bbox']}
+        for clause in clauses
+        if not clause['heading_only'] and len(clause['text']) >= min_chars
+    ]
@@ -0,0 +1,272 @@
+"""
+Cross-process shared state backed by SQLite
+===========================================
+
+When the app is served by several pre-forked workers (see gunicorn.conf.py)
+each worker is its own process, so in-memory dicts are not shared. The
+classes here keep caches and rate-limit state in one SQLite file (WAL mode)
+that every worker opens. A fresh connection is used per operation, so
+nothing has to be re-opened after fork.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, "state", "shared_state.sqlite3")
+
+
+def shared_db_path() -> str:
+    """Location of the shared state database (SHARED_STATE_DB overrides the default)"""
+    return os.getenv('SHARED_STATE_DB', DEFAULT_DB_PATH)
+
+
+def connect(db_path: str = None) -> sqlite3.Connection:
+    """Open a connection in autocommit mode with WAL enabled"""
+    db_path = db_path or shared_db_path()
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class SharedCache:
+    """JSON key/value cache with optional expiry, shared by all worker processes"""
+
+    def __init__(self, db_path: str = None, max_entries: int = 50000):
+        self.db_path = db_path or shared_db_path()
+        self.max_entries = max_entries
+        self._writes = 0
+        conn = connect(self.db_path)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+        finally:
+            conn.close()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        conn = connect(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float = None):
+        """Store a JSON-serializable value, replacing any previous entry"""
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        conn = connect(self.db_path)
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), expires_at, now)
+            )
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._prune(conn)
+        finally:
+            conn.close()
+
+    def _prune(self, conn: sqlite3.Connection):
+        """Drop expired entries and the oldest ones beyond max_entries"""
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        conn.execute("""
+            DELETE FROM cache WHERE rowid IN (
+                SELECT rowid FROM cache ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+
+class SharedRateLimiter:
+    """
+    Spaces out calls across all worker processes
+
+    Each caller atomically reserves the next free time slot in the database
+    and sleeps until it arrives, so N workers together never exceed one call
+    per min_interval seconds.
+    """
+
+    def __init__(self, name: str, min_interval: float, db_path: str = None):
+        self.name = name
+        self.min_interval = min_interval
+        self.db_path = db_path or shared_db_path()
+        conn = connect(self.db_path)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    name TEXT PRIMARY KEY,
+                    next_slot REAL NOT NULL
+                )
+            """)
+        finally:
+            conn.close()
+
+    def wait(self) -> float:
+        """Block until this caller's slot; returns the seconds slept"""
+        if self.min_interval <= 0:
+            return 0.0
+
+        conn = connect(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT next_slot FROM rate_limits WHERE name = ?", (self.name,)).fetchone()
+            now = time.time()
+            slot = max(now, row[0]) if row else now
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (name, next_slot) VALUES (?, ?)",
+                (self.name, slot + self.min_interval)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class SharedQuota:
+    """
+    Fixed-window request quota per client, shared by all worker processes
+
+    Each client may start `limit` requests per `window` seconds; limit <= 0
+    disables the quota.
+    """
+
+    def __init__(self, limit: int, window: float, db_path: str = None):
+        self.limit = limit
+        self.window = window
+        self.db_path = db_path or shared_db_path()
+        conn = connect(self.db_path)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS quotas (
+                    client TEXT PRIMARY KEY,
+                    window_start REAL NOT NULL,
+                    count INTEGER NOT NULL
+                )
+            """)
+        finally:
+            conn.close()
+
+    def hit(self, client: str) -> float:
+        """Count one request; returns 0 if allowed, else seconds until the client's window resets"""
+        if self.limit <= 0:
+            return 0.0
+
+        conn = connect(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT window_start, count FROM quotas WHERE client = ?", (client,)).fetchone()
+            now = time.time()
+            if not row or now - row[0] >= self.window:
+                conn.execute("INSERT OR REPLACE INTO quotas (client, window_start, count) VALUES (?, ?, 1)", (client, now))
+                retry_after = 0.0
+            elif row[1] < self.limit:
+                conn.execute("UPDATE quotas SET count = count + 1 WHERE client = ?", (client,))
+                retry_after = 0.0
+            else:
+                retry_after = row[0] + self.window - now
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return retry_after
+
+    def refund(self, client: str):
+        """Give back one request counted by hit(), e.g. for a request rejected before doing any work"""
+        if self.limit <= 0:
+            return
+
+        conn = connect(self.db_path)
+        try:
+            conn.execute("UPDATE quotas SET count = count - 1 WHERE client = ? AND count > 0", (client,))
+        finally:
+            conn.close()
+
+
+class SharedWorkerMetrics:
+    """
+    Latest metrics snapshot of every worker process, so any worker can report them all
+
+    Each worker overwrites its own row (keyed by pid); rows of workers that have
+    exited are kept for their counters and pruned after `max_age` seconds.
+    """
+
+    def __init__(self, name: str, db_path: str = None, max_age: float = 24 * 3600):
+        self.name = name
+        self.max_age = max_age
+        self.db_path = db_path or shared_db_path()
+        conn = connect(self.db_path)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS worker_metrics (
+                    name TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (name, pid)
+                )
+            """)
+        finally:
+            conn.close()
+
+    def publish(self, data: dict):
+        """Store this process's current snapshot"""
+        conn = connect(self.db_path)
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO worker_metrics (name, pid, data, updated_at) VALUES (?, ?, ?, ?)",
+                (self.name, os.getpid(), json.dumps(data), time.time())
+            )
+        finally:
+            conn.close()
+
+    def collect(self) -> list:
+        """Snapshots of all workers, each with 'pid', 'updated_at' and 'alive' added"""
+        conn = connect(self.db_path)
+        try:
+            conn.execute("DELETE FROM worker_metrics WHERE name = ? AND updated_at < ?",
+                         (self.name, time.time() - self.max_age))
+            rows = conn.execute(
+                "SELECT pid, data, updated_at FROM worker_metrics WHERE name = ? ORDER BY pid", (self.name,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        snapshots = []
+        for pid, data, updated_at in rows:
+            snapshot = json.loads(data)
+            snapshot.update({'pid': pid, 'updated_at': updated_at, 'alive': _pid_alive(pid)})
+            snapshots.append(snapshot)
+        return snapshots
+
+
+def _pid_alive(pid: int) -> bool:
+    """Whether a process with this pid still exists on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,257 @@
+"""
+Near-duplicate clause lookup with MinHash LSH
+=============================================
+
+Template-based contracts repeat the same clauses with different party
+names, dates and amounts, so an exact-text cache misses them. This module
+keeps a bounded in-memory MinHash LSH index of clauses Gemini has already
+classified. classify_text() asks it for a sufficiently similar prior
+clause before sending a block to the model and reuses that classification
+(flagged as reused) on a hit.
+"""
+
+import hashlib
+import random
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Words that flip or qualify an obligation; near-duplicates must agree on them exactly
+POLARITY_WORDS = {'not', 'no', 'never', 'without', 'except', 'unless', 'nor', 'neither',
+                  'shall', 'may', 'must', 'will', 'solely', 'only', 'any', 'all'}
+
+
+# "may" is left out: lowercase it is the modal verb, and capitalised "May" is handled below
+MONTHS = {'january', 'february', 'march', 'april', 'june', 'july', 'august', 'september',
+          'october', 'november', 'december', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep',
+          'sept', 'oct', 'nov', 'dec'}
+
+# Last word of a company name ("Acme Corp", "Beta Holdings LLC", "Gamma S.A.")
+ENTITY_SUFFIXES = {'inc', 'incorporated', 'corp', 'corporation', 'co', 'llc', 'llp', 'lp', 'ltd', 'limited',
+                   'plc', 'gmbh', 'ag', 'sa', 'sarl', 'bv', 'nv', 'pty', 'pvt', 'pte'}
+# First word of a person's name ("Mr John Smith")
+HONORIFICS = {'mr', 'mrs', 'ms', 'miss', 'dr', 'prof'}
+
+# Words capitalised only because they start a sentence; every other capitalised word is taken
+# as a defined term ("Indirect Losses", "Material Breach") that near-duplicates must share
+SENTENCE_WORDS = {'the', 'this', 'that', 'these', 'those', 'each', 'either', 'neither', 'any', 'all', 'no',
+                  'not', 'in', 'if', 'upon', 'on', 'for', 'of', 'to', 'by', 'with', 'from', 'and', 'or', 'nor',
+                  'notwithstanding', 'subject', 'except', 'unless', 'where', 'when', 'such', 'shall', 'may',
+                  'must', 'will', 'a', 'an', 'it', 'its', 'he', 'she', 'they', 'we', 'you', 'i', 'as', 'at',
+                  'after', 'before', 'during', 'without', 'within', 'under', 'following'}
+
+_TOKEN = re.compile(r"[$€£₹]?\d[\d,./:-]*|[A-Za-z][A-Za-z'&.-]*")
+
+
+def _is_name(run: List[str]) -> bool:
+    """A run of capitalised words with a company suffix or a leading honorific"""
+    if len(run) < 2:
+        return False
+    return (run[-1].lower().replace('.', '') in ENTITY_SUFFIXES
+            or run[0].lower().rstrip('.') in HONORIFICS)
+
+
+def _scan(text: str) -> List[Tuple[str, bool]]:
+    """
+    (word, capitalised) pairs with the parts that vary between copies of a template masked
+
+    Numbers, amounts and dates (including month names) become '#', and names
+    (capitalised runs with a company suffix or an honorific, e.g. "Acme
+    Corp", "Mr John Smith") become '@'. A run of masked words collapses to
+    one mask, so "1 January 2024" and "3/3/25" or "Acme Corp" and "Beta
+    Holdings LLC" look the same. Other capitalised words are kept: in a
+    contract they are usually defined terms.
+    """
+    tokens = [(match.group().rstrip('.'), match.start(), match.end()) for match in _TOKEN.finditer(text)]
+    tokens = [token for token in tokens if token[0]]
+
+    words = []
+
+    def emit(word, capitalised=False):
+        if word in ('#', '@') and words and words[-1][0] == word:
+            return
+        words.append((word, capitalised))
+
+    i = 0
+    while i < len(tokens):
+        token = tokens[i][0]
+        lower = token.lower()
+        if lower[0] in '$€£₹' or lower[0].isdigit() or lower in MONTHS or token == 'May':
+            emit('#')
+            i += 1
+            continue
+        if token[0].isupper():
+            # Capitalised words separated only by spaces form one run
+            j = i + 1
+            while (j < len(tokens) and tokens[j][0][0].isupper()
+                   and not text[tokens[j - 1][2]:tokens[j][1]].strip()):
+                j += 1
+            run = [t[0] for t in tokens[i:j]]
+            # "The Acme Corp": a leading sentence word is not part of the name
+            lead = 1 if run[0].lower() in SENTENCE_WORDS and len(run) > 1 else 0
+            if _is_name(run[lead:]):
+                if lead:
+                    emit(run[0].lower(), True)
+                emit('@')
+                i = j
+                continue
+        emit(lower, token[0].isupper())
+        i += 1
+    return words
+
+
+def _masked_words(text: str) -> List[str]:
+    """Lowercased words with names, numbers, amounts and dates masked"""
+    return [word for word, _ in _scan(text)]
+
+
+def clause_shingles(text: str, size: int = 3) -> set:
+    """Word n-grams of the clause with names, numbers, amounts and dates masked"""
+    words = _masked_words(text)
+    if len(words) < size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def polarity_key(text: str) -> Tuple[Tuple[str, int], ...]:
+    """Counts of negation/modality words, so 'shall' never matches 'shall not'"""
+    counts = {}
+    for word in re.findall(r"[a-z]+", text.lower()):
+        if word in POLARITY_WORDS:
+            counts[word] = counts.get(word, 0) + 1
+    return tuple(sorted(counts.items()))
+
+
+def defined_terms_key(text: str) -> Tuple[str, ...]:
+    """Capitalised words other than names and sentence starts, so 'Indirect Losses' never matches 'Direct Losses'"""
+    return tuple(sorted({word for word, capitalised in _scan(text)
+                         if capitalised and word not in SENTENCE_WORDS}))
+
+
+def match_key(text: str) -> Tuple:
+    """What a near-duplicate must share exactly: polarity words and defined terms"""
+    return polarity_key(text), defined_terms_key(text)
+
+
+class ClauseSimilarityIndex:
+    """Bounded LRU MinHash LSH index mapping clauses to their classifications"""
+
+    def __init__(self, threshold: float = 0.7, max_entries: int = 20000,
+                 num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                       for _ in range(num_perm)]
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # entry id -> (signature, match key, classification)
+        self._buckets = {}             # (band, band hash) -> set of entry ids
+        self._next_id = 0
+        self._stats = {'lookups': 0, 'hits': 0, 'added': 0, 'evicted': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and 0 < self.threshold <= 1
+
+    def _signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        shingles = clause_shingles(text)
+        if not shingles:
+            return None
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little')
+                  for s in shingles]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, int]]:
+        return [(band, hash(signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+
+    def lookup(self, text: str) -> Optional[Tuple[Dict[str, any], float]]:
+        """
+        Find the most similar indexed clause
+
+        Returns:
+            Tuple[Dict, float]: (its classification, estimated Jaccard similarity),
+            or None when nothing reaches the threshold
+        """
+        if not self.enabled:
+            return None
+        signature = self._signature(text)
+        if signature is None:
+            return None
+        required = match_key(text)
+
+        with self._lock:
+            self._stats['lookups'] += 1
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+
+            best_id, best_similarity = None, 0.0
+            for entry_id in candidates:
+                other, other_key, _ = self._entries[entry_id]
+                if other_key != required:
+                    continue
+                similarity = sum(1 for x, y in zip(signature, other) if x == y) / self.num_perm
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None or best_similarity < self.threshold:
+                return None
+            self._entries.move_to_end(best_id)
+            self._stats['hits'] += 1
+            return dict(self._entries[best_id][2]), best_similarity
+
+    def add(self, text: str, classification: Dict[str, any]):
+        """Index a clause classified by the model"""
+        if not self.enabled:
+            return
+        signature = self._signature(text)
+        if signature is None:
+            return
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (signature, match_key(text), dict(classification))
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+            self._stats['added'] += 1
+
+            while len(self._entries) > self.max_entries:
+                old_id, (old_signature, _, _) = self._entries.popitem(last=False)
+                for key in self._band_keys(old_signature):
+                    bucket = self._buckets.get(key)
+                    if bucket:
+                        bucket.discard(old_id)
+                        if not bucket:
+                            del self._buckets[key]
+                self._stats['evicted'] += 1
+
+    def stats(self) -> Dict[str, any]:
+        """Size, configuration and hit rate of the index in this process"""
+        with self._lock:
+            lookups = self._stats['lookups']
+            return {
+                'enabled': self.enabled,
+                'threshold': self.threshold,
+                'max_entries': self.max_entries,
+                'size': len(self._entries),
+                'lookups': lookups,
+                'hits': self._stats['hits'],
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else 0.0,
+                'added': self._stats['added'],
+                'evicted': self._stats['evicted']
+            }
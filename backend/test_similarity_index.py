@@ -0,0 +1,54 @@
+"""Near-duplicate reuse must survive the parts that change between copies of a template"""
+
+from similarity_index import ClauseSimilarityIndex
+
+TEMPLATE = ("This Agreement is made on {date} between {party} and the Supplier, who shall indemnify "
+            "{party} against all claims, losses and expenses up to {amount} arising from the Services.")
+
+
+def _indexed(text):
+    index = ClauseSimilarityIndex()
+    index.add(text, {'risk_level': 'red', 'reasoning': 'Broad indemnity'})
+    return index
+
+
+def test_reuses_clause_with_different_party_names():
+    index = _indexed(TEMPLATE.format(date="1 January 2024", party="Acme Corp", amount="$50,000"))
+    match = index.lookup(TEMPLATE.format(date="1 January 2024", party="Beta LLC", amount="$50,000"))
+    assert match is not None and match[0]['risk_level'] == 'red'
+
+
+def test_reuses_clause_with_different_names_dates_and_amounts():
+    index = _indexed(TEMPLATE.format(date="1 January 2024", party="Acme Corp", amount="$50,000"))
+    match = index.lookup(TEMPLATE.format(date="3 March 2025", party="Beta Holdings LLC", amount="$1,250,000.00"))
+    assert match is not None and match[1] >= index.threshold
+
+
+def test_does_not_swap_defined_parties():
+    index = _indexed("The Customer shall indemnify the Supplier against all claims arising from the Services.")
+    assert index.lookup("The Supplier shall indemnify the Customer against all claims arising from the Services.") is None
+
+
+def test_does_not_swap_defined_terms():
+    swaps = [
+        ("The Supplier shall not be liable for any Indirect Losses arising under this Agreement.",
+         "The Supplier shall not be liable for any Direct Losses arising under this Agreement."),
+        ("The Customer may terminate this Agreement at any time for Convenience by giving notice to the Supplier.",
+         "The Customer may terminate this Agreement at any time for Material Breach by giving notice to the Supplier."),
+        ("If the Supplier misses a Service Level it shall pay the Customer Liquidated Damages for each day of delay.",
+         "If the Supplier misses a Service Level it shall pay the Customer Service Credits for each day of delay."),
+        ("Any dispute arising out of this Agreement shall be finally resolved by Binding Arbitration in London.",
+         "Any dispute arising out of this Agreement shall be finally resolved by Mediation in London."),
+    ]
+    for indexed, other in swaps:
+        assert _indexed(indexed).lookup(other) is None, other
+
+
+def test_reuses_clause_naming_a_person():
+    index = _indexed("Mr John Smith shall act as the Supplier's representative for the Services under this Agreement.")
+    assert index.lookup("Ms Jane Doe shall act as the Supplier's representative for the Services under this Agreement.")
+
+
+def test_does_not_reuse_across_negation():
+    index = _indexed("The Supplier shall be liable for all indirect and consequential damages under this Agreement.")
+    assert index.lookup("The Supplier shall not be liable for any indirect or consequential damages under this Agreement.") is None
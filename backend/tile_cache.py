@@ -0,0 +1,189 @@
+"""
+Cached page tiles for highlighted previews
+==========================================
+
+Rather than downloading a whole highlighted PDF, the viewer can request one
+page at a time as a PNG rendered with PyMuPDF at the zoom it needs. Rendered
+tiles are kept in an on-disk LRU cache (file modification time is the
+recency stamp), and neighbouring pages are rendered in the background so
+scrolling hits the cache.
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from shared_state import BASE_DIR
+
+DEFAULT_TILE_DIR = os.path.join(BASE_DIR, "state", "tiles")
+
+MIN_ZOOM = 0.25
+MAX_ZOOM = 4.0
+ZOOM_STEP = 0.25
+
+# Page counts are remembered for this many PDF versions before the memo is reset
+MAX_REMEMBERED_DOCUMENTS = 1024
+
+
+def normalize_zoom(zoom: float) -> float:
+    """Clamp and round the zoom so nearby requests share cached tiles"""
+    zoom = min(MAX_ZOOM, max(MIN_ZOOM, zoom))
+    return round(round(zoom / ZOOM_STEP) * ZOOM_STEP, 2)
+
+
+def render_page_png(pdf_path: str, page_index: int, zoom: float) -> bytes:
+    """
+    Rasterize one page, annotations included
+
+    Raises:
+        IndexError: page_index is outside the document
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open(pdf_path) as doc:
+        if not 0 <= page_index < doc.page_count:
+            raise IndexError(f"Page {page_index} is out of range (document has {doc.page_count} pages)")
+        pixmap = doc[page_index].get_pixmap(matrix=fitz.Matrix(zoom, zoom), annots=True)
+        return pixmap.tobytes("png")
+
+
+class TileCache:
+    """Size-bounded directory of rendered tiles, evicting least recently used first"""
+
+    def __init__(self, directory: str = None, max_bytes: int = None):
+        self.directory = directory or os.getenv("TILE_CACHE_DIR", DEFAULT_TILE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("TILE_CACHE_MB", 256)) * 1024 * 1024)
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._approx_bytes = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of the cached tile (and mark it recently used), or None"""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def contains(self, key: str) -> bool:
+        """Whether a tile is cached, without touching its recency"""
+        return os.path.exists(self._path(key))
+
+    def put(self, key: str, data: bytes) -> str:
+        """Store a tile atomically and evict old tiles if over budget"""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._approx_bytes += len(data)
+            if self._approx_bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def _evict(self):
+        """Delete least recently used tiles until the cache is at 80% of its budget"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".png"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * 0.8:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                continue
+        self._approx_bytes = total
+
+
+class PageTileService:
+    """Renders page tiles through the cache and prefetches neighbouring pages"""
+
+    def __init__(self, cache: TileCache = None, prefetch_pages: int = None):
+        self.cache = cache or TileCache()
+        self.prefetch_pages = prefetch_pages if prefetch_pages is not None else int(os.getenv("TILE_PREFETCH", 1))
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._pending = set()
+        self._page_counts = {}
+
+    @staticmethod
+    def _file_version(pdf_path: str) -> str:
+        stat = os.stat(pdf_path)
+        return f"{os.path.abspath(pdf_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    @staticmethod
+    def tile_key(pdf_path: str, page_index: int, zoom: float) -> str:
+        """Identifies the rendered pixels: file identity and version, page and zoom"""
+        raw = f"{PageTileService._file_version(pdf_path)}:{page_index}:{zoom}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def page_count(self, pdf_path: str) -> int:
+        """Pages in the PDF, remembered per file version"""
+        version = self._file_version(pdf_path)
+        with self._executor_lock:
+            count = self._page_counts.get(version)
+        if count is None:
+            import fitz  # PyMuPDF
+
+            with fitz.open(pdf_path) as doc:
+                count = doc.page_count
+            with self._executor_lock:
+                if len(self._page_counts) >= MAX_REMEMBERED_DOCUMENTS:
+                    self._page_counts.clear()
+                self._page_counts[version] = count
+        return count
+
+    def tile(self, pdf_path: str, page_index: int, zoom: float) -> Tuple[str, str]:
+        """
+        Return (tile path, ETag) for a page, rendering it on a cache miss
+
+        Raises:
+            IndexError: page_index is outside the document
+        """
+        zoom = normalize_zoom(zoom)
+        key = self.tile_key(pdf_path, page_index, zoom)
+        path = self.cache.get(key)
+        if path is None:
+            path = self.cache.put(key, render_page_png(pdf_path, page_index, zoom))
+        self.prefetch(pdf_path, page_index, zoom)
+        return path, key
+
+    def prefetch(self, pdf_path: str, page_index: int, zoom: float):
+        """Render the neighbouring pages in the background if they are not cached yet"""
+        page_count = self.page_count(pdf_path)
+        for offset in range(1, self.prefetch_pages + 1):
+            for neighbour in (page_index + offset, page_index - offset):
+                if not 0 <= neighbour < page_count:
+                    continue
+                key = self.tile_key(pdf_path, neighbour, zoom)
+                with self._executor_lock:
+                    # contains(), not get(): a prefetch check must not count as a use for LRU eviction
+                    if key in self._pending or self.cache.contains(key):
+                        continue
+                    self._pending.add(key)
+                    if self._executor is None:
+                        # Created lazily so it is built inside each forked worker
+                        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tile-prefetch")
+                self._executor.submit(self._render_into_cache, pdf_path, neighbour, zoom, key)
+
+    def _render_into_cache(self, pdf_path: str, page_index: int, zoom: float, key: str):
+        try:
+            self.cache.put(key, render_page_png(pdf_path, page_index, zoom))
+        except (IndexError, OSError):
+            pass  # the PDF was replaced or removed
+        finally:
+            with self._executor_lock:
+                self._pending.discard(key)